@@ -0,0 +1,16 @@
+"""
+EpiScan's scanning core, usable without the GUI
+
+Importing this package has no side effects and does not load Qt or matplotlib. A single file can be scanned with
+    job = episcan.scan_file("movie.mkv", frameSpan=20)
+    episcan.render_graph(job, "movie.mkv.png")
+"""
+from .cache import cache_suffix, is_cacheComplete, load_cache, save_cache
+from .catalog import Catalog, catalog_default
+from .extract import FramePipeline, FrameReducer, scan_chunk
+from .job import Job, ProgressReporter, analyze_job, extract_job, get_frameTimes, open_job, print_report, run_job, scan_file, summarize_job, types
+from .profiler import StageProfiler, get_peakMemory
+from .render import generate_color, render_graph
+from .scenes import export_previews, find_intervals, find_scenes
+from .spans import SpanTable, calc_spanTable
+from .stream import StreamDetector, print_event, stream_file, summary_thresholds
@@ -0,0 +1,217 @@
+"""
+Headless batch mode: scans whole directories of video files on a pool of processes
+
+    python -m episcan [options] <directory or glob> [...]
+
+Every file gets its cache file, a graph ('<video>.png') and a summary ('<video>.summary.json') next to it.
+With --catalog, results and summaries are also added to a catalog, and files it already holds are skipped wherever they are.
+A report covering the whole batch, including timings and failures for each file, is written at the end.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+from .cache import is_cacheComplete
+from .catalog import Catalog, catalog_default
+from .job import Job, get_frameTimes, run_job, summarize_job, types
+from .render import render_graph
+from .scenes import export_previews, find_scenes
+from .stream import summary_thresholds
+
+video_extensions = (".mkv", ".mp4", ".avi", ".mov", ".m4v", ".wmv", ".webm", ".mpg", ".mpeg", ".ts", ".flv")
+summary_suffix = ".summary.json"
+
+
+# Expands directories (recursively) and glob patterns into a list of video files, without duplicates
+def collect_files(paths, extensions=video_extensions):
+    files = []
+    for path in paths:
+        if (os.path.isdir(path)):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files += [os.path.join(root, name) for name in sorted(names) if name.lower().endswith(extensions)]
+        elif (os.path.isfile(path)):
+            files.append(path)
+        else:
+            files += [file for file in sorted(glob.glob(path, recursive=True)) if os.path.isfile(file) and file.lower().endswith(extensions)]
+    return list(dict.fromkeys(os.path.abspath(file) for file in files))
+
+
+def write_json(file_path, data):
+    with open(file_path + ".tmp", "w") as file:
+        json.dump(data, file, indent=2)
+    os.replace(file_path + ".tmp", file_path)
+
+
+# Scans a single file in a worker process: all analysis modes are summarized, the graph shows the first one
+# Never raises, failures are returned as part of the result so they end up in the batch report
+# With 'is_traceRequested', the stages of the scan are saved as a trace file next to the video. With 'previews'
+# ("sheet" or "clip"), the flagged scenes of the first analysis mode are exported to '<video>.previews'.
+# 'report' is passed on to run_job, to follow the progress of each analysis mode. A 'job' given by the caller is used
+# for the scan, so the caller can cancel it with job.set_cancelRequested().
+def scan_batchFile(file_path, settings, is_graphRequested=True, is_traceRequested=False, previews=None, report=None, job=None):
+    timestamp = time.perf_counter()
+    result = {"file": file_path, "size": os.path.getsize(file_path), "status": "failed"}
+    try:
+        if (job == None):
+            job = Job()
+        job.file_path = file_path
+        for name, value in settings.items():
+            getattr(job, "set_" + name)(value)
+        job.set_onEvent(None)
+        if (is_traceRequested):
+            job.set_tracePath(file_path + ".trace.json")
+        if (report == None):
+            report = lambda task, current, total=100: None
+        summary = {"file": file_path, "modes": {}}
+        for type in range(1, len(types) + 1):
+            if (type == 4 and job.tileGrid == 0):
+                continue  # No tiles collected
+            job.set_type(type)
+            if (not run_job(job, report, is_loadRequested=(type == 1))):
+                if (job.is_stopOnUnsafe and job.detector != None and job.detector.is_unsafe):
+                    # Stopped early, the flashing found so far decides the verdict
+                    summary.update(job.detector.summarize())
+                    summary.update({"fps": job.fps, "frameCount": job.frameCount, "frameSpan": job.frameSpan, "isComplete": False})
+                    write_json(file_path + summary_suffix, summary)
+                    result.update({"status": "unsafe", "verdict": "unsafe", "summary": file_path + summary_suffix})
+                    job.cap.release()
+                    break
+                raise RuntimeError("Scan did not complete")
+            if (job.frameCount <= 0):
+                raise RuntimeError("No video frames found")
+            summary["modes"][types[type - 1]] = summarize_job(job)
+            summary["modes"][types[type - 1]]["scenes"] = find_scenes(job)
+            if (type == 1 and job.detector != None):
+                summary["events"] = job.detector.events
+            if (type == 1 and is_graphRequested):
+                render_graph(job, file_path + ".png")
+                result["png"] = file_path + ".png"
+            if (type == 1 and previews != None):
+                result["previews"] = export_previews(job, summary["modes"][types[0]]["scenes"], kind=previews)
+        else:
+            # Flashing in any of the metrics makes a file unsafe, e.g. saturated red barely changes the absolute brightness
+            peak = max(mode_summary["peak"] for mode_summary in summary["modes"].values())
+            summary["verdict"] = "unsafe" if peak > summary_thresholds[-1] else "ok"
+            summary.update({"fps": job.fps, "frameCount": job.frameCount, "seconds": float(get_frameTimes(job)[-1]), "frameSpan": job.frameSpan})
+            write_json(file_path + summary_suffix, summary)
+            if (job.catalogPath != None and not job.is_fastScan):
+                with Catalog(job.catalogPath) as catalog:
+                    for mode, mode_summary in summary["modes"].items():
+                        catalog.save_summary(file_path, mode, job.frameSpan, mode_summary)
+            result["verdict"] = summary["verdict"]
+            result.update({"status": "scanned", "summary": file_path + summary_suffix, "pipeline": job.pipelineStats, "profile": job.profiler.get_stats()})
+            job.cap.release()
+    except Exception as error:
+        result["error"] = str(error)
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = time.perf_counter() - timestamp
+    return result
+
+
+# Does the catalog hold summaries of all analysis modes the settings call for? Files that have not changed since they
+# were added are recognized without reading them.
+def is_catalogued(catalog, file_path, settings):
+    modes = catalog.get_summaries(file_path, settings.get("frameSpan", 20))
+    return all(types[type - 1] in modes for type in range(1, len(types) + 1) if type != 4 or settings.get("tileGrid"))
+
+
+# Returns why a file does not need to be scanned again ("summary" or "catalog"), or None if it does
+# Fast scans never write a cache file, so for them a summary is enough to skip a file.
+def find_upToDate(file_path, settings, catalog=None):
+    if ((settings.get("fastScan") or is_cacheComplete(file_path)) and os.path.isfile(file_path + summary_suffix)):
+        return "summary"
+    if (catalog != None and is_catalogued(catalog, file_path, settings)):
+        return "catalog"
+    return None
+
+
+# Scans all files on 'worker_count' processes, largest files first so the pool stays busy until the end
+# Files with a complete cache and a summary, or catalogued ones, are skipped unless 'is_forced'. Returns the batch report.
+def run_batch(files, settings, worker_count=None, is_forced=False, is_graphRequested=True, report_path=None, is_traceRequested=False, previews=None):
+    started = datetime.datetime.now().isoformat(timespec="seconds")
+    timestamp = time.perf_counter()
+    results = []
+    queued = []
+    catalog = Catalog(settings["catalogPath"]) if settings.get("catalogPath") != None and not is_forced else None
+    for file_path in files:
+        reason = find_upToDate(file_path, settings, catalog) if not is_forced else None
+        if (reason == "summary"):
+            results.append({"file": file_path, "size": os.path.getsize(file_path), "status": "skipped", "seconds": 0.0, "summary": file_path + summary_suffix})
+        elif (reason == "catalog"):
+            results.append({"file": file_path, "size": os.path.getsize(file_path), "status": "skipped", "seconds": 0.0, "catalog": catalog.catalog_path})
+        else:
+            queued.append(file_path)
+    if (catalog != None):
+        catalog.close()
+    queued.sort(key=os.path.getsize, reverse=True)
+    print("Scanning " + str(len(queued)) + " files, skipping " + str(len(results)) + " files with valid cached data")
+
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=worker_count, mp_context=context) as executor:
+        futures = [executor.submit(scan_batchFile, file_path, settings, is_graphRequested, is_traceRequested, previews) for file_path in queued]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print("[" + str(len(results)) + "/" + str(len(files)) + "] " + result["status"] + ": " + result["file"] + " (" + str(round(result["seconds"], 1)) + " s)" + (" - " + result["error"] if "error" in result else ""))
+
+    batch = {"started": started, "seconds": time.perf_counter() - timestamp, "workers": worker_count or os.cpu_count(), "settings": settings,
+             "counts": {status: sum(1 for result in results if result["status"] == status) for status in ("scanned", "unsafe", "skipped", "failed")},
+             "files": sorted(results, key=lambda result: result["file"])}
+    if (report_path != None):
+        write_json(report_path, batch)
+        print("Batch report saved as " + report_path)
+    return batch
+
+
+# Options shared by all ways of scanning files without the GUI, see get_settings()
+def add_scanArguments(parser):
+    parser.add_argument("--frame-span", type=int, default=20, help="size of frame span to be considered in analysis")
+    parser.add_argument("--tiles", type=int, default=0, help="split frames into a grid of TILES x TILES to find local flashing (default: off)")
+    parser.add_argument("--reducers", type=int, default=2, help="threads reducing decoded frames per file")
+    parser.add_argument("--decode-width", type=int, default=0, help="shrink wider frames to this many pixels before reducing them, faster on 4K sources but the perceived brightness is approximate (default: full resolution)")
+    parser.add_argument("--no-graph", action="store_true", help="do not save a graph for each file")
+    parser.add_argument("--fast", action="store_true", help="sample each file first and only read its suspicious parts in full (estimated results)")
+    parser.add_argument("--stop-on-unsafe", action="store_true", help="stop reading a file as soon as flashing in the red area is found")
+    parser.add_argument("--previews", choices=("sheet", "clip"), help="export the flagged scenes of each file as contact sheets or short clips to VIDEO.previews")
+    parser.add_argument("--catalog", metavar="FILE", help="add results to this catalog of scanned videos and skip the files it holds, wherever they are")
+    parser.add_argument("--trace", action="store_true", help="save the stages of each scan as VIDEO.trace.json (open in chrome://tracing or ui.perfetto.dev)")
+
+
+# Job settings for the options of add_scanArguments()
+def get_settings(args):
+    return {"frameSpan": args.frame_span, "reducerCount": args.reducers, "decodeWidth": args.decode_width, "tileGrid": args.tiles, "fastScan": args.fast, "stopOnUnsafe": args.stop_on_unsafe, "catalogPath": args.catalog}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="episcan", description="Scan video files for flashing scenes without the GUI")
+    parser.add_argument("paths", nargs="*", help="video files, directories (scanned recursively) or glob patterns")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of files scanned at the same time (default: number of CPUs)")
+    parser.add_argument("--report", default="episcan_report.json", help="where to save the batch report (default: %(default)s)")
+    add_scanArguments(parser)
+    parser.add_argument("--import-catalog", metavar="FILE", help="add all videos of another catalog to the catalog (default: " + catalog_default + ")")
+    parser.add_argument("--export-catalog", metavar="FILE", help="copy the catalog into FILE for sharing, without the locations of the videos")
+    parser.add_argument("--force", action="store_true", help="scan files again even if valid cached data exists")
+    args = parser.parse_args(argv)
+
+    if (args.import_catalog != None or args.export_catalog != None):
+        with Catalog(args.catalog or catalog_default) as catalog:
+            if (args.import_catalog != None):
+                print("Imported " + str(catalog.import_catalog(args.import_catalog)) + " videos from " + args.import_catalog)
+            if (args.export_catalog != None):
+                catalog.export_catalog(args.export_catalog)
+                print("Catalog exported to " + args.export_catalog)
+        if (not args.paths):
+            return 0
+    files = collect_files(args.paths)
+    if (not files):
+        print("No video files found")
+        return 1
+    batch = run_batch(files, get_settings(args), args.workers, args.force, not args.no_graph, args.report, args.trace, args.previews)
+    return 1 if batch["counts"]["failed"] else 0
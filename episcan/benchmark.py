@@ -0,0 +1,437 @@
+"""
+Benchmark and regression suite: generates synthetic videos with known content, scans them and checks the results
+against the frames that were written. Every stage is timed separately and the results are saved as a JSON report,
+so two reports can be compared to spot changes in speed or accuracy:
+    python -m episcan.benchmark --output before.json
+    python -m episcan.benchmark --output after.json --compare before.json
+With --decode, 1080p and 4K videos are decoded and reduced with and without reused frame buffers and at full and
+reduced resolution instead, showing the time and memory allocated per frame of each.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy
+
+from .cache import cache_suffix, load_cache, save_cache
+from .extract import FramePipeline, FrameReducer
+from .job import Job, analyze_job, extract_job, open_job, summarize_job
+from .profiler import get_pageFaults
+from .render import render_graph
+from .spans import SpanTable, calc_spanTable
+from .stream import summary_thresholds
+
+report_version = 1  # Version of the report's layout, reports of different versions are not compared
+accuracy_atol = 3.0  # Highest difference allowed between a frame's values before and after compression
+regression_tolerance = 0.2  # Relative slowdown of a stage reported as a regression when comparing reports
+regression_minSeconds = 0.05  # Slowdowns shorter than this are measurement noise and never reported
+fast_peakRatio = 0.9  # Share of each peak of the full scan a fast scan has to find as well
+
+# Synthetic videos: what happens in the middle fifth of each video (or the share given as "flashing"), all other frames
+# are calm. "fps" and "seconds" override the frame rate and the length of the profile.
+scenarios = {
+    "calm": {"kind": "calm"},
+    "cuts": {"kind": "cuts", "interval": 2.0},  # Hard cuts every 2 seconds throughout the video
+    "flash3hz": {"kind": "flash", "hz": 3},  # Full screen flashing
+    "flash10hz": {"kind": "flash", "hz": 10},
+    "flash30hz": {"kind": "flash", "hz": 30, "fps": 60},  # Needs 60 fps, as each frame is a flash of its own
+    "partial10hz": {"kind": "partial", "hz": 10},  # Flashing of the top right quarter of the screen only
+    "lines10hz": {"kind": "lines", "hz": 10},  # Flashing of every other block of 4 lines, half of the screen
+    "red5hz": {"kind": "red", "hz": 5},  # Saturated red flashes
+    "burst10hz": {"kind": "flash", "hz": 10, "seconds": 60, "flashing": 0.05},  # 3 seconds of flashing in a minute, which a fast scan has to find without reading all of it
+}
+profiles = {
+    "quick": [(320, 180, 10), (1280, 720, 10)],  # Width, height, seconds
+    "full": [(320, 180, 60), (1280, 720, 60), (1920, 1080, 30)],
+}
+frame_span = 20
+tile_grid = 4
+decode_sizes = [(1920, 1080, 4), (3840, 2160, 4)]  # Width, height, seconds of the videos of the decode benchmark
+decode_width = 960  # Width the decode benchmark compares full resolution with
+
+
+# Returns frame i of a scenario. All frames share a static noise texture, so they are not trivial to compress.
+def generate_frame(scenario, i, fps, frame_count, texture):
+    frame = texture.copy()
+    kind = scenario["kind"]
+    share = scenario.get("flashing", 0.2)
+    is_flashing = (0.5 - share / 2) * frame_count <= i < (0.5 + share / 2) * frame_count
+    is_on = int(i * 2 * scenario.get("hz", 1) / fps) % 2 == 1
+    if (kind == "calm"):
+        # Slow fade up and down over the whole video
+        cv2.add(frame, int(20 + 20 * numpy.sin(2 * numpy.pi * i / frame_count)), dst=frame)
+    elif (kind == "cuts"):
+        if (int(i / fps / scenario["interval"]) % 2 == 1):
+            cv2.add(frame, 100, dst=frame)
+    elif (is_flashing and is_on):
+        height, width = frame.shape[:2]
+        if (kind == "flash"):
+            frame[:] = 230
+        elif (kind == "partial"):
+            frame[:height // 2, width // 2:] = 230
+        elif (kind == "lines"):
+            frame[numpy.arange(height) % 8 >= 4] = 230
+        elif (kind == "red"):
+            frame[:] = (0, 0, 255)
+    return frame
+
+
+# The 5 values of table 'brightness' for a frame, calculated with plain numpy instead of a FrameReducer, so the
+# values the scan returns are checked against an independent reference
+def calc_referenceValues(frame):
+    b, g, r = [frame[:, :, k].astype(numpy.float64) for k in range(0, 3)]
+    absolute = (0.299 * r + 0.587 * g + 0.114 * b).mean()
+    perceived = numpy.sqrt(0.299 * r ** 2 + 0.587 * g ** 2 + 0.114 * b ** 2).mean()
+    return absolute, perceived, r.mean(), g.mean(), b.mean()
+
+
+# Writes a synthetic video and returns its fps, frame count and the exact 5 values of every frame before compression
+def write_video(file_path, scenario, width, height, seconds):
+    fps = scenario.get("fps", 25)
+    frame_count = int(scenario.get("seconds", seconds) * fps)
+    texture = numpy.random.default_rng(0).integers(50, 90, (height, width, 3), dtype=numpy.uint8)
+    writer = cv2.VideoWriter(file_path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    if (not writer.isOpened()):
+        raise IOError("Could not write video file " + file_path)
+    reference = numpy.zeros((5, frame_count))
+    for i in range(0, frame_count):
+        frame = generate_frame(scenario, i, fps, frame_count, texture)
+        reference[:, i] = calc_referenceValues(frame)
+        writer.write(frame)
+    writer.release()
+    return fps, frame_count, reference
+
+
+def check(checks, name, passed, value, expected):
+    checks.append({"name": name, "passed": bool(passed), "value": value, "expected": expected})
+
+
+# What has to be found in each scenario, based on how it was generated
+def check_scenario(checks, scenario, job, summaries):
+    kind = scenario["kind"]
+    seconds_flashing = scenario.get("flashing", 0.2) * job.frameCount / job.fps
+    if (kind == "calm"):
+        check(checks, "calm: nothing above 35", summaries[1]["peak"] < 35, summaries[1]["peak"], "< 35")
+    elif (kind == "cuts"):
+        cuts = int(job.frameCount / job.fps / scenario["interval"])
+        limit = cuts * frame_span / job.fps
+        check(checks, "cuts: no sustained changes", summaries[1]["secondsAbove"]["35"] <= limit, summaries[1]["secondsAbove"]["35"], "<= " + str(limit) + " s above 35")
+    elif (kind == "flash"):
+        check(checks, "flash: peak above 95", summaries[1]["peak"] > 95, summaries[1]["peak"], "> 95")
+        check(checks, "flash: found while flashing", summaries[1]["secondsAbove"]["35"] >= 0.5 * seconds_flashing, summaries[1]["secondsAbove"]["35"], ">= " + str(0.5 * seconds_flashing) + " s above 35")
+    elif (kind == "partial"):
+        check(checks, "partial: worst tile above 95", summaries[4]["peak"] > 95, summaries[4]["peak"], "> 95")
+        check(checks, "partial: worst tile in the top right quarter", summaries[4]["worstTile"]["row"] < tile_grid // 2 and summaries[4]["worstTile"]["column"] >= tile_grid // 2, summaries[4]["worstTile"], "row < " + str(tile_grid // 2) + ", column >= " + str(tile_grid // 2))
+        check(checks, "partial: diluted in the full frame mean", summaries[1]["peak"] < summaries[4]["peak"], summaries[1]["peak"], "< " + str(summaries[4]["peak"]))
+    elif (kind == "lines"):
+        check(checks, "lines: peak above 75", summaries[1]["peak"] > 75, summaries[1]["peak"], "> 75")
+    elif (kind == "red"):
+        check(checks, "red: R channel above 95", summaries[3]["peak"] > 95, summaries[3]["peak"], "> 95")
+
+
+def time_call(function, *args):
+    timestamp = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - timestamp, result
+
+
+# Scans a synthetic video stage by stage and returns the timings and results of all checks
+def benchmark_video(file_path, scenario, fps, frame_count, reference):
+    result = {"fps": fps, "frames": frame_count, "seconds": {}, "framesPerSecond": {}, "accuracy": {}, "checks": []}
+    seconds = result["seconds"]
+    quiet = lambda task, current, total=100: None
+    if (os.path.isfile(file_path + cache_suffix)):
+        os.remove(file_path + cache_suffix)
+
+    # 1. Decoding only, as a baseline for the extraction
+    timestamp = time.perf_counter()
+    cap = cv2.VideoCapture(file_path)
+    frames_decoded = 0
+    while cap.read()[0]:
+        frames_decoded += 1
+    cap.release()
+    seconds["decode"] = time.perf_counter() - timestamp
+
+    # 2. Extraction of all values per frame, including saving them to the cache file
+    job = Job()
+    job.file_path = file_path
+    job.set_frameSpan(frame_span)
+    job.set_tileGrid(tile_grid)
+    job.set_onEvent(None)
+    job.set_checkpointInterval(1e9)
+    open_job(job)
+    seconds["extract"], is_extracted = time_call(extract_job, job, quiet)
+    if (not is_extracted or frames_decoded == 0):
+        check(result["checks"], "extraction completed", False, frames_decoded, str(frame_count) + " frames")
+        return result
+    result["framesPerSecond"]["decode"] = frames_decoded / seconds["decode"]
+    result["framesPerSecond"]["extract"] = frame_count / seconds["extract"]
+    errors = numpy.abs(numpy.asarray(job.brightness, dtype=numpy.float64) - reference).max(axis=1)
+    result["accuracy"]["maxError"] = {"absolute": errors[0], "perceived": errors[1], "r": errors[2], "g": errors[3], "b": errors[4]}
+    check(result["checks"], "frame values match the frames written", errors.max() <= accuracy_atol, float(errors.max()), "<= " + str(accuracy_atol))
+    check(result["checks"], "all frames read", frames_decoded == frame_count, frames_decoded, frame_count)
+
+    # 3. Statistics across frame spans for every analysis mode, including the peaks across all spans
+    summaries = {}
+    for type in range(1, 5):
+        job.set_type(type)
+        seconds_analyze, is_analyzed = time_call(analyze_job, job, quiet)
+        seconds_summarize, summaries[type] = time_call(summarize_job, job)
+        seconds["analyze" + str(type)] = seconds_analyze + seconds_summarize
+    result["summaries"] = {str(type): summaries[type] for type in summaries}
+    check_scenario(result["checks"], scenario, job, summaries)
+    dense = calc_spanTable(job.brightness[0], frame_span, is_scaled=True)
+    difference = float(numpy.abs(numpy.asarray(SpanTable(job.brightness[0], frame_span, is_scaled=True)) - dense).max())
+    check(result["checks"], "span table matches the dense reference", difference <= 1e-3, difference, "<= 0.001")
+    # The detector follows all metrics at once, so its peak is the highest of all modes
+    difference = abs(job.detector.summarize()["peak"] - max(summaries[type]["peak"] for type in summaries)) if job.detector != None else 0.0
+    check(result["checks"], "streaming peak matches the span tables", difference <= 1e-3, difference, "<= 0.001")
+
+    # 4. Cache files
+    seconds["cacheSave"] = time_call(save_cache, file_path, job.brightness, job.fps, job.frameCount, 0b11111, None, job.tiles)[0]
+    timestamp = time.perf_counter()
+    cached = load_cache(file_path, job.fps, job.frameCount)
+    float(cached[0].sum())  # Touch all values, as they are memory-mapped
+    seconds["cacheLoad"] = time.perf_counter() - timestamp
+
+    # 5. Graph of the absolute brightness
+    job.set_type(1)
+    analyze_job(job, quiet)
+    seconds["render"] = time_call(render_graph, job, file_path + ".png")[0]
+    job.cap.release()
+
+    # 6. Fast scan, which must not miss any flashing the full scan found
+    os.remove(file_path + cache_suffix)
+    fast = Job()
+    fast.file_path = file_path
+    fast.set_frameSpan(frame_span)
+    fast.set_tileGrid(tile_grid)
+    fast.set_onEvent(None)
+    fast.set_fastScan(True)
+    open_job(fast)
+    seconds["fastScan"], is_extracted = time_call(extract_job, fast, quiet)
+    result["fastScan"] = {}
+    for type in range(1, 5):
+        fast.set_type(type)
+        analyze_job(fast, quiet)
+        peak = summarize_job(fast)["peak"] if is_extracted else 0.0
+        result["fastScan"][str(type)] = peak
+        if (summaries[type]["peak"] > summary_thresholds[0]):
+            expected = fast_peakRatio * summaries[type]["peak"]
+            check(result["checks"], "fast scan: peak of mode " + str(type) + " found", peak >= expected, peak, ">= " + str(round(expected, 1)))
+    # Unless most of the video turned out to be suspicious, so all of it was read like in a full scan, sampling has to pay off
+    result["fastScan"]["isReadInFull"] = fast.exactFrames is None
+    if (fast.exactFrames is not None):
+        check(result["checks"], "fast scan: faster than the full extract", seconds["fastScan"] < seconds["extract"], seconds["fastScan"], "< " + str(round(seconds["extract"], 3)) + " s")
+    fast.cap.release()
+    return result
+
+
+def get_platform():
+    return {"python": platform.python_version(), "opencv": cv2.__version__, "numpy": numpy.__version__, "machine": platform.machine(), "system": platform.system(), "cpus": os.cpu_count()}
+
+
+# Generates all videos of a profile in 'directory', benchmarks them and returns the report
+def run_benchmark(directory, profile="quick", names=None):
+    report = {"version": report_version, "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "profile": profile, "platform": get_platform(), "videos": {}}
+    for width, height, seconds in profiles[profile]:
+        for name, scenario in scenarios.items():
+            if (names and name not in names):
+                continue
+            key = name + "_" + str(width) + "x" + str(height) + "_" + str(scenario.get("seconds", seconds)) + "s"
+            file_path = os.path.join(directory, key + ".avi")
+            print("Benchmarking " + key)
+            fps, frame_count, reference = write_video(file_path, scenario, width, height, seconds)
+            result = benchmark_video(file_path, scenario, fps, frame_count, reference)
+            result.update({"scenario": name, "width": width, "height": height})
+            report["videos"][key] = result
+            for failed in [item for item in result["checks"] if not item["passed"]]:
+                print("  FAILED: " + failed["name"] + ": " + str(failed["value"]) + ", expected " + str(failed["expected"]))
+            print("  " + ", ".join(stage + " " + str(round(value, 3)) + " s" for stage, value in result["seconds"].items()))
+    report["passed"] = all(item["passed"] for video in report["videos"].values() for item in video["checks"])
+    return report
+
+
+# Decodes all frames of a video file either into a new frame each (OpenCV's default) or into the same buffer and
+# returns the time, page faults and bytes allocated per frame
+def benchmark_read(file_path, is_bufferReused):
+    cap = cv2.VideoCapture(file_path)
+    frame = None
+    frames_read = 0
+    bytes_allocated = 0
+    faults = get_pageFaults()
+    timestamp = time.perf_counter()
+    while True:
+        buffer = frame if is_bufferReused else None
+        is_validFrame, frame = cap.read(buffer)
+        if not is_validFrame:
+            break
+        frames_read += 1
+        if (frame is not buffer):
+            bytes_allocated += frame.nbytes
+    seconds = time.perf_counter() - timestamp
+    faults = get_pageFaults() - faults if faults != None else None
+    cap.release()
+    count = max(1, frames_read)
+    return seconds, {"frames": frames_read, "msPerFrame": 1000 * seconds / count, "bytesAllocatedPerFrame": bytes_allocated / count,
+                     "pageFaultsPerFrame": faults / count if faults != None else None}
+
+
+# Reduces every frame of a video file at full resolution and shrunk to 'width' and returns the time per frame of
+# both plus the largest difference between their values. Repeated frames are not skipped, so every frame is reduced.
+def benchmark_reduce(file_path, width):
+    cap = cv2.VideoCapture(file_path)
+    reducers = [FrameReducer(is_repeatChecked=False), FrameReducer(is_repeatChecked=False, width=width)]
+    seconds = [0.0, 0.0]
+    errors = numpy.zeros(5)
+    frame = None
+    frames_read = 0
+    while True:
+        is_validFrame, frame = cap.read(frame)
+        if not is_validFrame:
+            break
+        values = []
+        for k in range(0, 2):
+            timestamp = time.perf_counter()
+            values.append(reducers[k].reduce(frame))
+            seconds[k] += time.perf_counter() - timestamp
+        errors = numpy.maximum(errors, numpy.abs(numpy.subtract(values[0], values[1])))
+        frames_read += 1
+    cap.release()
+    return seconds, frames_read, errors
+
+
+# Scans a video file with a FramePipeline and returns its throughput counters plus the values of all frames
+def benchmark_pipeline(file_path, frame_count, width):
+    cap = cv2.VideoCapture(file_path)
+    brightness = numpy.zeros((5, frame_count))
+    pipeline = FramePipeline(cap, brightness, 0, frame_count, width=width)
+    pipeline.start_threads()
+    pipeline.join()
+    cap.release()
+    return pipeline.get_stats(), brightness
+
+
+# Shows what reusing frame buffers and shrinking frames right after decoding save on a video file
+def benchmark_decode(file_path, frame_count):
+    result = {"frames": frame_count, "seconds": {}, "checks": []}
+    seconds = result["seconds"]
+
+    # 1. Decoding only, into a new frame each time and into the same buffer
+    seconds["read"], result["read"] = benchmark_read(file_path, False)
+    seconds["readIntoBuffer"], result["readIntoBuffer"] = benchmark_read(file_path, True)
+    check(result["checks"], "all frames decoded into the buffer", result["readIntoBuffer"]["frames"] == frame_count, result["readIntoBuffer"]["frames"], frame_count)
+    check(result["checks"], "no frames allocated when decoding into the buffer", result["readIntoBuffer"]["bytesAllocatedPerFrame"] * frame_count <= result["read"]["bytesAllocatedPerFrame"],
+          result["readIntoBuffer"]["bytesAllocatedPerFrame"], "only the first frame")
+
+    # 2. Reducing only, at full resolution and shrunk
+    reduce_seconds, frames_reduced, errors = benchmark_reduce(file_path, decode_width)
+    seconds["reduce"], seconds["reduceShrunk"] = reduce_seconds
+    result["reduce"] = {"msPerFrame": 1000 * reduce_seconds[0] / max(1, frames_reduced)}
+    result["reduceShrunk"] = {"width": decode_width, "msPerFrame": 1000 * reduce_seconds[1] / max(1, frames_reduced),
+                              "maxError": {"absolute": errors[0], "perceived": errors[1], "r": errors[2], "g": errors[3], "b": errors[4]}}
+
+    # 3. Both together, as in a scan. The pipeline decodes into the buffers its reducers hand back.
+    seconds["pipeline"], (stats, brightness) = time_call(benchmark_pipeline, file_path, frame_count, 0)
+    result["pipeline"] = {"totalFps": stats["totalFps"], "framesAllocated": stats["framesAllocated"]}
+    seconds["pipelineShrunk"], (stats_shrunk, brightness_shrunk) = time_call(benchmark_pipeline, file_path, frame_count, decode_width)
+    result["pipelineShrunk"] = {"width": decode_width, "totalFps": stats_shrunk["totalFps"], "framesAllocated": stats_shrunk["framesAllocated"]}
+    cap = cv2.VideoCapture(file_path)
+    reference = numpy.zeros((5, frame_count))
+    frame = None
+    for i in range(0, frame_count):
+        is_validFrame, frame = cap.read(frame)
+        if not is_validFrame:
+            break
+        reference[:, i] = FrameReducer().reduce(frame)
+    cap.release()
+    difference = float(numpy.abs(brightness - reference).max())
+    check(result["checks"], "pipeline values match reading frame by frame", difference == 0, difference, 0)
+    frames_inFlight = 8 * (4 + 2 + 1)  # Batch size times the batches queued, being reduced and being decoded
+    check(result["checks"], "pipeline frames allocated are bounded", stats["framesAllocated"] <= frames_inFlight, stats["framesAllocated"], "<= " + str(frames_inFlight))
+    return result
+
+
+# Generates the videos of the decode benchmark in 'directory', benchmarks them and returns the report
+def run_decodeBenchmark(directory):
+    report = {"version": report_version, "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "profile": "decode", "platform": get_platform(), "videos": {}}
+    for width, height, seconds in decode_sizes:
+        key = "decode_" + str(width) + "x" + str(height) + "_" + str(seconds) + "s"
+        file_path = os.path.join(directory, key + ".avi")
+        print("Benchmarking " + key)
+        fps, frame_count, reference = write_video(file_path, scenarios["flash10hz"], width, height, seconds)
+        result = benchmark_decode(file_path, frame_count)
+        result.update({"width": width, "height": height})
+        report["videos"][key] = result
+        for failed in [item for item in result["checks"] if not item["passed"]]:
+            print("  FAILED: " + failed["name"] + ": " + str(failed["value"]) + ", expected " + str(failed["expected"]))
+        for name in ("read", "readIntoBuffer"):
+            faults = result[name]["pageFaultsPerFrame"]
+            print("  " + name + ": " + str(round(result[name]["msPerFrame"], 2)) + " ms, " + str(round(result[name]["bytesAllocatedPerFrame"] / 2 ** 20, 2)) + " MiB allocated"
+                  + (", " + str(round(faults)) + " page faults" if faults != None else "") + " per frame")
+        print("  reduce: " + str(round(result["reduce"]["msPerFrame"], 2)) + " ms per frame, shrunk to " + str(decode_width) + ": " + str(round(result["reduceShrunk"]["msPerFrame"], 2))
+              + " ms per frame, perceived brightness off by up to " + str(round(result["reduceShrunk"]["maxError"]["perceived"], 2)))
+        print("  pipeline: " + str(int(result["pipeline"]["totalFps"])) + " frames/s, shrunk to " + str(decode_width) + ": " + str(int(result["pipelineShrunk"]["totalFps"])) + " frames/s")
+    report["passed"] = all(item["passed"] for video in report["videos"].values() for item in video["checks"])
+    return report
+
+
+# Lists the stages that got slower than 'tolerance' compared to an earlier report and all checks that changed
+def compare_reports(report, baseline, tolerance=regression_tolerance):
+    changes = []
+    if (baseline.get("version") != report["version"]):
+        return ["Baseline report has a different version, not comparing"]
+    for key, video in report["videos"].items():
+        if (key not in baseline["videos"]):
+            continue
+        before = baseline["videos"][key]
+        for stage, seconds in video["seconds"].items():
+            seconds_before = before["seconds"].get(stage)
+            if (seconds_before and seconds > seconds_before * (1 + tolerance) and seconds - seconds_before > regression_minSeconds):
+                changes.append(key + ": " + stage + " got slower, " + str(round(seconds_before, 3)) + " s -> " + str(round(seconds, 3)) + " s")
+        passed_before = {item["name"]: item["passed"] for item in before["checks"]}
+        for item in video["checks"]:
+            if (passed_before.get(item["name"], item["passed"]) != item["passed"]):
+                changes.append(key + ": check '" + item["name"] + "' " + ("passes now" if item["passed"] else "fails now"))
+    return changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="episcan.benchmark", description="Benchmark and check EpiScan on synthetic videos")
+    parser.add_argument("--profile", choices=sorted(profiles), default="quick", help="resolutions and lengths of the videos (default: %(default)s)")
+    parser.add_argument("--scenario", action="append", choices=sorted(scenarios), help="only run this scenario (can be given several times)")
+    parser.add_argument("--output", default="episcan_benchmark.json", help="where to save the report (default: %(default)s)")
+    parser.add_argument("--compare", help="earlier report to compare the results with")
+    parser.add_argument("--decode", action="store_true", help="benchmark decoding and reducing 1080p and 4K frames with and without reused buffers instead")
+    parser.add_argument("--keep", help="directory to keep the generated videos in (default: a temporary directory)")
+    args = parser.parse_args(argv)
+
+    directory = args.keep if args.keep else tempfile.mkdtemp(prefix="episcan_benchmark_")
+    os.makedirs(directory, exist_ok=True)
+    try:
+        report = run_decodeBenchmark(directory) if args.decode else run_benchmark(directory, args.profile, args.scenario)
+    finally:
+        if (not args.keep):
+            shutil.rmtree(directory, ignore_errors=True)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2, default=float)
+    print("Report saved as " + args.output + ", all checks " + ("passed" if report["passed"] else "did NOT pass"))
+
+    changes = []
+    if (args.compare):
+        with open(args.compare) as file:
+            changes = compare_reports(report, json.load(file))
+        print("Compared with " + args.compare + ": " + (str(len(changes)) + " changes" if changes else "no regressions"))
+        for change in changes:
+            print("  " + change)
+    return 0 if report["passed"] and not changes else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Cache files holding the brightness values of a video file's frames, stored next to the video file
+"""
+import hashlib
+import json
+import math
+import os
+import struct
+
+import numpy
+
+cache_suffix = ".episcan"  # Results for a video file are cached next to it, using this file extension
+cache_magic = b"\x93EPISCAN"  # First bytes of every cache file
+cache_version = 4  # Version of the cache file format, files of other versions are not read
+cache_versionsReadable = (1, 2, 3, 4)  # Version 1 files were always complete, as they could not hold checkpoints, version 2 files hold no tiles, version 3 files no timestamps
+metrics_all = 0b11111  # Bitmap of the 5 lines in table 'brightness', bit 0 being the absolute brightness
+
+
+# Fingerprint of a video file's contents that is quick to calculate: its size plus a hash over 3 blocks of 1 MiB each
+def calc_partialHash(file_path, block_size=1 << 20):
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(file_path, "rb") as file:
+        for offset in (0, (size - block_size) // 2, size - block_size):
+            file.seek(max(0, offset))
+            digest.update(file.read(block_size))
+    return digest.hexdigest()
+
+
+def get_sourceInfo(file_path):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": calc_partialHash(file_path)}
+
+
+# Bitmap of the lines in table 'brightness' that hold data (bit 0 = line 0 and so on)
+def get_metrics(brightness):
+    metrics = 0
+    for i in range(0, len(brightness)):
+        if (numpy.any(brightness[i])):
+            metrics |= 1 << i
+    return metrics
+
+
+"""
+Cache files ('<video file>.episcan') store table 'brightness' in binary form:
+1. The magic bytes cache_magic, followed by the format version (uint16) and the header length (uint32), little-endian
+2. The header: a JSON object with the video's fps and frame count, the bitmap of populated metrics ('metrics'),
+   the size, modification time and partial hash of the video file the data was collected from ('source')
+   and the number of leading frames that have been read so far ('framesDone', a checkpoint if below the frame count)
+   as well as the size n of the tile grid ('tileGrid', 0 if there are no tiles) and whether timestamps follow ('hasTimestamps')
+3. Table 'brightness' as float32 values (5 x frameCount, row by row), starting at a multiple of 64 bytes
+4. Only if tileGrid > 0: the tile means as uint8 values (2 * n * n x frameCount, row by row)
+5. Only if hasTimestamps: the time of each frame in seconds as float32 values (frameCount)
+"""
+def save_cache(file_path, brightness, fps, frame_count, metrics=metrics_all, frames_done=None, tiles=None, timestamps=None):
+    if (frames_done == None):
+        frames_done = frame_count
+    tile_grid = math.isqrt(len(tiles) // 2) if tiles is not None else 0
+    header = {"fps": fps, "frameCount": frame_count, "metrics": metrics, "source": get_sourceInfo(file_path), "framesDone": frames_done, "tileGrid": tile_grid, "hasTimestamps": timestamps is not None}
+    header = json.dumps(header).encode()
+    header += b" " * (-(len(cache_magic) + 6 + len(header)) % 64)  # Align the data so it can be memory-mapped
+    # Write to a temporary file first, so an interrupted write never leaves a broken cache behind
+    with open(file_path + cache_suffix + ".tmp", "wb") as file:
+        file.write(cache_magic + struct.pack("<HI", cache_version, len(header)) + header)
+        file.write(numpy.ascontiguousarray(brightness, dtype="<f4").tobytes())
+        if (tile_grid > 0):
+            file.write(numpy.ascontiguousarray(tiles, dtype=numpy.uint8).tobytes())
+        if (timestamps is not None):
+            file.write(numpy.ascontiguousarray(timestamps, dtype="<f4").tobytes())
+    os.replace(file_path + cache_suffix + ".tmp", file_path + cache_suffix)
+
+
+# Returns the header of a cache file and the offset of its data, or None if there is no readable cache file
+def read_cacheHeader(file_path):
+    cache_path = file_path + cache_suffix
+    if (not os.path.isfile(cache_path)):
+        return None
+    try:
+        with open(cache_path, "rb") as file:
+            magic = file.read(len(cache_magic))
+            version, header_length = struct.unpack("<HI", file.read(6))
+            if (magic != cache_magic or version not in cache_versionsReadable):
+                print("Cache file " + cache_path + " has an unknown format, ignoring it")
+                return None
+            header = json.loads(file.read(header_length))
+        header.setdefault("framesDone", header["frameCount"])
+        header.setdefault("tileGrid", 0)
+        header.setdefault("hasTimestamps", False)
+        offset = len(cache_magic) + 6 + header_length
+        # All data the header announces has to be there, a truncated file would fail once it is memory-mapped
+        size = offset + 4 * 5 * header["frameCount"] + 2 * header["tileGrid"] ** 2 * header["frameCount"] + (4 * header["frameCount"] if header["hasTimestamps"] else 0)
+        if (os.path.getsize(cache_path) < size):
+            print("Cache file " + cache_path + " is truncated, ignoring it")
+            return None
+    except (struct.error, ValueError, KeyError, TypeError) as error:
+        # ValueError covers broken JSON as well
+        print("Cache file " + cache_path + " is damaged, ignoring it (" + str(error) + ")")
+        return None
+    return header, offset
+
+
+# Is there a complete cache file for the video file in its current state? Does not open the video file itself.
+def is_cacheComplete(file_path):
+    cached = read_cacheHeader(file_path)
+    if (cached == None):
+        return False
+    header = cached[0]
+    return header["metrics"] == metrics_all and header["framesDone"] >= header["frameCount"] and header["source"] == get_sourceInfo(file_path)
+
+
+# Returns table 'brightness' memory-mapped from the cache file plus its bitmap of populated metrics
+# and the number of frames read so far, or None if there is no cache or it does not belong to the video file in its current state
+def load_cache(file_path, fps, frame_count):
+    cache_path = file_path + cache_suffix
+    cached = read_cacheHeader(file_path)
+    if (cached == None):
+        return None
+    header, offset = cached
+    source = get_sourceInfo(file_path)
+    if (header["source"] != source):
+        print("Cache file " + cache_path + " belongs to a different or modified video file, ignoring it")
+        return None
+    # Older versions stored the fps truncated to an integer
+    if (header["frameCount"] != frame_count or (abs(header["fps"] - fps) > 1e-6 and header["fps"] != int(fps))):
+        print("Cache file " + cache_path + " does not match the video's frame count or fps, ignoring it")
+        return None
+    # Copy-on-write, so the data can be changed in memory without touching the cache file
+    brightness = numpy.memmap(cache_path, dtype="<f4", mode="c", offset=offset, shape=(5, frame_count))
+    return brightness, header["metrics"], header["framesDone"]
+
+
+# Returns the tile means memory-mapped from the cache file if it holds a tile grid of size 'tile_grid', otherwise None
+# Call after load_cache() accepted the cache file, as the source is not checked again
+def load_cacheTiles(file_path, frame_count, tile_grid):
+    cached = read_cacheHeader(file_path)
+    if (cached == None or cached[0]["tileGrid"] != tile_grid or cached[0]["frameCount"] != frame_count or tile_grid <= 0):
+        return None
+    offset = cached[1] + 5 * frame_count * 4
+    return numpy.memmap(file_path + cache_suffix, dtype=numpy.uint8, mode="c", offset=offset, shape=(2 * tile_grid * tile_grid, frame_count))
+
+
+# Returns the time of each frame memory-mapped from the cache file, or None if it holds no timestamps
+# Call after load_cache() accepted the cache file, as the source is not checked again
+def load_cacheTimestamps(file_path, frame_count):
+    cached = read_cacheHeader(file_path)
+    if (cached == None or not cached[0]["hasTimestamps"] or cached[0]["frameCount"] != frame_count):
+        return None
+    tile_grid = cached[0]["tileGrid"]
+    offset = cached[1] + 5 * frame_count * 4 + 2 * tile_grid * tile_grid * frame_count
+    return numpy.memmap(file_path + cache_suffix, dtype="<f4", mode="c", offset=offset, shape=(frame_count,))
+
+
+# Converts results cached by older versions ('<video file>.csv') to a cache file. The CSV file is renamed afterwards.
+# Older versions did not collect all metrics (the perceived brightness is missing), the cache file only marks those
+# found as populated. A CSV file without any data is left as it is.
+def import_csvCache(file_path, fps, frame_count):
+    if (not os.path.isfile(file_path + ".csv")):
+        return None
+    print("Importing cached data from " + file_path + ".csv")
+    brightness = numpy.loadtxt(file_path + ".csv", delimiter=',', ndmin=2)
+    if (brightness.shape != (5, frame_count)):
+        print("Cached data in " + file_path + ".csv does not match the video's frame count, ignoring it")
+        return None
+    metrics = get_metrics(brightness)
+    if (metrics == 0):
+        print("Cached data in " + file_path + ".csv holds no values, ignoring it")
+        return None
+    try:
+        save_cache(file_path, brightness, fps, frame_count, metrics)
+        os.replace(file_path + ".csv", file_path + ".csv.imported")
+    except OSError as error:
+        print("WARNING: Could not convert " + file_path + ".csv: " + str(error))
+    return brightness, metrics, frame_count
@@ -0,0 +1,172 @@
+"""
+Catalog of scanned videos: a SQLite database holding the brightness values and summaries of every video scanned,
+keyed by a fingerprint of the video's contents. Moved, renamed or remounted files are recognized without reading
+them again, and videos on read-only shares can be scanned once and looked up afterwards.
+"""
+import datetime
+import json
+import math
+import os
+import sqlite3
+
+import numpy
+
+from .cache import calc_partialHash
+
+catalog_default = os.path.join(os.path.expanduser("~"), ".episcan", "catalog.sqlite")  # Used if no other path is given
+catalog_version = 2  # Version of the database schema, stored as 'user_version'. Version 1 catalogs hold no timestamps.
+
+"""
+Tables of the catalog:
+- videos: one row per fingerprint (calc_partialHash: size plus hash of 3 sampled blocks) with fps, frame count, tile grid
+  and table 'brightness' (float32), the tile means (uint8) and the time of each frame (float32 seconds) as blobs
+- paths: where a video has been seen, with its size and modification time at that point, so a file that has not
+  changed is recognized by a single indexed lookup, without hashing it
+- summaries: the key figures of summarize_job per video, analysis mode and frame span, as JSON
+"""
+catalog_schema = """
+CREATE TABLE IF NOT EXISTS videos (fingerprint TEXT PRIMARY KEY, size INTEGER, fps REAL, frameCount INTEGER,
+    tileGrid INTEGER, brightness BLOB, tiles BLOB, added TEXT, timestamps BLOB);
+CREATE TABLE IF NOT EXISTS paths (path TEXT PRIMARY KEY, fingerprint TEXT, size INTEGER, mtime_ns INTEGER);
+CREATE INDEX IF NOT EXISTS paths_fingerprint ON paths (fingerprint);
+CREATE TABLE IF NOT EXISTS summaries (fingerprint TEXT, mode TEXT, frameSpan INTEGER, summary TEXT,
+    PRIMARY KEY (fingerprint, mode, frameSpan));
+"""
+
+
+class Catalog:
+    def __init__(self, catalog_path=catalog_default):
+        self.catalog_path = catalog_path
+        if (os.path.dirname(catalog_path)):
+            os.makedirs(os.path.dirname(catalog_path), exist_ok=True)
+        # Several processes of a batch may write at the same time, so they wait for each other instead of failing
+        self.connection = sqlite3.connect(catalog_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if (version > catalog_version):
+            self.connection.close()
+            raise IOError("Catalog " + catalog_path + " was created by a newer version (" + str(version) + ")")
+        with self.connection:
+            if (version == 1):
+                self.connection.execute("ALTER TABLE videos ADD COLUMN timestamps BLOB")
+            self.connection.executescript(catalog_schema)
+            self.connection.execute("PRAGMA user_version=" + str(catalog_version))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Returns the fingerprint of a video file. Files that have been seen before at the same path with the same size
+    # and modification time are not read again. With 'is_hashAllowed' False, unknown files return None instead.
+    def get_fingerprint(self, file_path, is_hashAllowed=True):
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        row = self.connection.execute("SELECT fingerprint FROM paths WHERE path = ? AND size = ? AND mtime_ns = ?", (file_path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if (row != None):
+            return row[0]
+        if (not is_hashAllowed):
+            return None
+        fingerprint = calc_partialHash(file_path)
+        # Remember where the video has been seen, only if it is in the catalog, so lookups of new files stay cheap
+        if (self.connection.execute("SELECT 1 FROM videos WHERE fingerprint = ?", (fingerprint,)).fetchone() != None):
+            self.add_path(file_path, fingerprint, stat)
+        return fingerprint
+
+    def add_path(self, file_path, fingerprint, stat=None):
+        file_path = os.path.abspath(file_path)
+        if (stat == None):
+            stat = os.stat(file_path)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO paths VALUES (?, ?, ?, ?)", (file_path, fingerprint, stat.st_size, stat.st_mtime_ns))
+
+    # Has the video file been scanned completely before, wherever it was located back then?
+    def is_scanned(self, file_path):
+        fingerprint = self.get_fingerprint(file_path)
+        return self.connection.execute("SELECT 1 FROM videos WHERE fingerprint = ?", (fingerprint,)).fetchone() != None
+
+    # Stores the complete results of a scan. Estimated values of a fast scan must not be stored.
+    def save_scan(self, file_path, brightness, fps, frame_count, tiles=None, timestamps=None):
+        fingerprint = calc_partialHash(file_path)
+        tile_grid = 0
+        tiles_blob = None
+        if (tiles is not None):
+            tile_grid = math.isqrt(len(tiles) // 2)
+            tiles_blob = numpy.ascontiguousarray(tiles, dtype=numpy.uint8).tobytes()
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (fingerprint, os.path.getsize(file_path), fps, frame_count, tile_grid,
+                                     numpy.ascontiguousarray(brightness, dtype="<f4").tobytes(), tiles_blob,
+                                     datetime.datetime.now().isoformat(timespec="seconds"),
+                                     numpy.ascontiguousarray(timestamps, dtype="<f4").tobytes() if timestamps is not None else None))
+        self.add_path(file_path, fingerprint)
+        return fingerprint
+
+    # Returns table 'brightness' of the video file plus its tile means if the catalog holds a tile grid of size
+    # 'tile_grid' and the time of each frame (None otherwise), or None if the video file is not in the catalog
+    # or does not match fps and frame count
+    def load_scan(self, file_path, fps, frame_count, tile_grid=0):
+        fingerprint = self.get_fingerprint(file_path)
+        row = self.connection.execute("SELECT fps, frameCount, tileGrid, brightness, tiles, timestamps FROM videos WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        if (row == None):
+            return None
+        # Older versions stored the fps truncated to an integer, like in cache files
+        if (row[1] != frame_count or (abs(row[0] - fps) > 1e-6 and row[0] != int(fps))):
+            print("Catalog entry for " + file_path + " does not match the video's frame count or fps, ignoring it")
+            return None
+        brightness = numpy.frombuffer(row[3], dtype="<f4").reshape(5, frame_count)
+        tiles = None
+        if (tile_grid > 0 and row[2] == tile_grid):
+            tiles = numpy.frombuffer(row[4], dtype=numpy.uint8).reshape(2 * tile_grid * tile_grid, frame_count)
+        timestamps = numpy.frombuffer(row[5], dtype="<f4") if row[5] != None else None
+        return brightness, tiles, timestamps
+
+    def save_summary(self, file_path, mode, frame_span, summary):
+        fingerprint = self.get_fingerprint(file_path)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)", (fingerprint, mode, frame_span, json.dumps(summary)))
+
+    # Returns the summaries of all analysis modes of the video file for 'frame_span' as {mode: summary}
+    def get_summaries(self, file_path, frame_span):
+        fingerprint = self.get_fingerprint(file_path)
+        rows = self.connection.execute("SELECT mode, summary FROM summaries WHERE fingerprint = ? AND frameSpan = ?", (fingerprint, frame_span))
+        return {mode: json.loads(summary) for mode, summary in rows}
+
+    # Copies the catalog, or only the videos with the given fingerprints, into another catalog file for sharing.
+    # Where the videos were located is not exported.
+    def export_catalog(self, export_path, fingerprints=None):
+        Catalog(export_path).close()  # Creates the tables
+        self.connection.execute("ATTACH DATABASE ? AS export", (export_path,))
+        try:
+            with self.connection:
+                if (fingerprints == None):
+                    self.connection.execute("INSERT OR REPLACE INTO export.videos SELECT * FROM main.videos")
+                    self.connection.execute("INSERT OR REPLACE INTO export.summaries SELECT * FROM main.summaries")
+                else:
+                    for fingerprint in fingerprints:
+                        self.connection.execute("INSERT OR REPLACE INTO export.videos SELECT * FROM main.videos WHERE fingerprint = ?", (fingerprint,))
+                        self.connection.execute("INSERT OR REPLACE INTO export.summaries SELECT * FROM main.summaries WHERE fingerprint = ?", (fingerprint,))
+        finally:
+            self.connection.execute("DETACH DATABASE export")
+
+    # Adds all videos and summaries of another catalog file. Entries already in this catalog are kept.
+    # Returns the number of videos added.
+    def import_catalog(self, import_path):
+        if (not os.path.isfile(import_path)):
+            raise IOError("Catalog " + import_path + " not found")
+        self.connection.execute("ATTACH DATABASE ? AS imported", (import_path,))
+        try:
+            with self.connection:
+                count = self.connection.execute("SELECT COUNT(*) FROM imported.videos WHERE fingerprint NOT IN (SELECT fingerprint FROM main.videos)").fetchone()[0]
+                # Catalogs of older versions lack some columns, those stay empty
+                columns = ", ".join(row[1] for row in self.connection.execute("PRAGMA imported.table_info(videos)"))
+                self.connection.execute("INSERT OR IGNORE INTO main.videos (" + columns + ") SELECT " + columns + " FROM imported.videos")
+                self.connection.execute("INSERT OR IGNORE INTO main.summaries SELECT * FROM imported.summaries")
+        finally:
+            self.connection.execute("DETACH DATABASE imported")
+        return count
+
@@ -0,0 +1,352 @@
+"""
+Reading video frames and reducing them to their brightness values, either sequentially or in chunks by frame range
+"""
+import math
+import queue
+import threading
+import time
+
+import cv2
+import numpy
+
+seek_overlap = 8  # Number of frames each chunk reads past its end when scanning in parallel, used to verify the next chunk's seek
+scan_cancelEvent = None  # Set by the main process to stop a worker process scanning a chunk
+
+
+# Tells whether a frame repeats the previous one exactly. Every pixel is compared, as a flash in a few lines or a small
+# part of the screen must never be mistaken for a repeat. With 'is_copied', the last frame is kept as a copy, so its
+# buffer may be reused. Otherwise only a reference to it is kept, and the caller must not decode into it before the next
+# frame has been compared (see FramePipeline.run_decoder).
+class RepeatDetector:
+    def __init__(self, is_copied=True):
+        self.previous = None
+        self.is_copied = is_copied
+
+    def is_repeated(self, frame):
+        if (self.previous is not None and self.previous.shape == frame.shape and cv2.norm(frame, self.previous, cv2.NORM_INF) == 0):
+            return True
+        if not self.is_copied:
+            self.previous = frame
+            return False
+        if (self.previous is None or self.previous.shape != frame.shape):
+            self.previous = numpy.empty_like(frame)
+        numpy.copyto(self.previous, frame)
+        return False
+
+
+# Reduces a single BGR video frame to the 5 values stored per frame in table 'brightness'
+# All intermediate images are written into work buffers which are allocated once and reused for every frame
+# With a 'tile_grid' of n, each frame is also split into n x n tiles, whose luminance and red channel means are
+# returned by reduce_tiles(). A single area resize down to n x n pixels averages all tiles at once.
+# Frames repeating the previous one (telecined, static or duplicated frames) get its values without being reduced again,
+# unless 'is_repeatChecked' is False. The frames have to be passed in the order of the video for this.
+# With a 'width', wider frames are shrunk to it (into a buffer of their own) before their 5 values are taken. The means
+# of the color channels barely change, the perceived brightness is taken from the averaged pixels and gets slightly
+# lower wherever a frame has fine detail. Tiles are always taken from the full frame. 0 = full resolution.
+class FrameReducer:
+    def __init__(self, tile_grid=0, is_repeatChecked=True, width=0):
+        self.shape = None  # Shape of the frames the work buffers were allocated for
+        self.tile_grid = tile_grid
+        self.repeats = RepeatDetector() if is_repeatChecked else None
+        self.width = width
+        self.small = None  # Shrunk copy of the last frame
+        self.values = None  # Values of the last frame
+        self.is_repeated = False  # Did the last frame repeat the one before?
+        self.frames_repeated = 0
+        if (tile_grid > 0):
+            self.tiles = numpy.empty((tile_grid, tile_grid, 3), dtype=numpy.uint8)
+            self.tiles_gray = numpy.empty((tile_grid, tile_grid), dtype=numpy.uint8)
+            self.tile_values = numpy.empty(2 * tile_grid * tile_grid, dtype=numpy.uint8)
+        # Lookup table for the perceived brightness, holding .114*B^2, .587*G^2 and .299*R^2 (OpenCV uses BGR order)
+        levels = numpy.arange(256, dtype=numpy.float32) ** 2
+        self.lut_perceived = numpy.empty((1, 256, 3), dtype=numpy.float32)
+        self.lut_perceived[0, :, 0] = 0.114 * levels
+        self.lut_perceived[0, :, 1] = 0.587 * levels
+        self.lut_perceived[0, :, 2] = 0.299 * levels
+        self.channel_sum = numpy.ones((1, 3), dtype=numpy.float32)  # Adds up the 3 weighted channels
+
+    def allocate(self, shape):
+        self.shape = shape
+        self.gray = numpy.empty(shape[:2], dtype=numpy.uint8)
+        self.squares = numpy.empty(shape, dtype=numpy.float32)
+        self.perceived = numpy.empty(shape[:2], dtype=numpy.float32)
+
+    def shrink(self, frame):
+        shape = (max(1, round(frame.shape[0] * self.width / frame.shape[1])), self.width) + frame.shape[2:]
+        if (self.small is None or self.small.shape != shape):
+            self.small = numpy.empty(shape, dtype=frame.dtype)
+        cv2.resize(frame, (shape[1], shape[0]), dst=self.small, interpolation=cv2.INTER_AREA)
+        return self.small
+
+    def reduce(self, frame):
+        self.is_repeated = self.repeats != None and self.repeats.is_repeated(frame)
+        if (self.is_repeated):
+            self.frames_repeated += 1
+            return self.values
+        if (self.width > 0 and frame.shape[1] > self.width):
+            frame = self.shrink(frame)
+        if (frame.shape != self.shape):
+            self.allocate(frame.shape)
+        self.values = self.reduce_frame(frame)
+        return self.values
+
+    def reduce_frame(self, frame):
+        # 1. Absolute brightness, using the same grayscale conversion as before
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        # 2. Perceived brightness: sqrt( .299 R^2 + .587 G^2 + .114 B^2 ) for each pixel
+        cv2.LUT(frame, self.lut_perceived, dst=self.squares)
+        cv2.transform(self.squares, self.channel_sum, dst=self.perceived)
+        cv2.sqrt(self.perceived, dst=self.perceived)
+        # 3.-5. Average of each color channel
+        b, g, r, _ = cv2.mean(frame)
+        return (cv2.mean(self.gray)[0], cv2.mean(self.perceived)[0], r, g, b)
+
+    # Returns the luminance means of all tiles (row by row), followed by their red channel means
+    # The returned array is reused for the next frame. Call after reduce() for the same frame.
+    def reduce_tiles(self, frame):
+        if (self.is_repeated):
+            return self.tile_values
+        cv2.resize(frame, (self.tile_grid, self.tile_grid), dst=self.tiles, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.tiles, cv2.COLOR_BGR2GRAY, dst=self.tiles_gray)
+        count = self.tile_grid * self.tile_grid
+        self.tile_values[:count] = self.tiles_gray.reshape(count)
+        self.tile_values[count:] = self.tiles[:, :, 2].reshape(count)
+        return self.tile_values
+
+
+# Reads frames on a background thread while a pool of threads reduces them to their brightness values
+# Frames are passed on in batches through a bounded queue, so the decoder blocks instead of piling up frames in memory
+# if reducing is slower than decoding. OpenCV releases the GIL, so decoding and reducing run at the same time.
+# Frames are decoded into buffers that the reducers hand back once a batch is done, so after the first few batches no
+# more frames are allocated. The pool never holds more buffers than frames can be in flight at once.
+# 'width' is passed on to the FrameReducer of each reducer thread.
+# Each reducer thread only sees some of the frames, so the decoder tells which frames repeat the previous one. These are
+# not passed on, their values are copied from the frame before once all frames up to them have been reduced.
+# Frames are compared against the previous frame's own buffer, which is held back from decoding until the next frame
+# that does not repeat it has been decoded, instead of being copied.
+class FramePipeline:
+    def __init__(self, cap, brightness, start, stop, reducer_count=2, queue_size=4, batch_size=8, tiles=None, timestamps=None, width=0):
+        self.cap = cap
+        self.brightness = brightness  # Table the values of frames start...stop-1 are written to
+        self.tiles = tiles  # Table the tile means of these frames are written to, if any (2 * n * n lines)
+        self.timestamps = timestamps  # Array the time of each of these frames is written to (in seconds), if any
+        self.tile_grid = math.isqrt(len(tiles) // 2) if tiles is not None else 0
+        self.start = start
+        self.stop = stop
+        self.batch_size = batch_size
+        self.width = width
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.buffers = queue.Queue()  # Frames that have been reduced, to be decoded into again
+        self.reducers = [threading.Thread(target=self.run_reducer, daemon=True) for i in range(0, max(1, reducer_count))]
+        self.decoder = threading.Thread(target=self.run_decoder, daemon=True)
+        self.is_stopped = False
+        self.error = None  # Exception raised in one of the threads, re-raised by join()
+        self.lock = threading.Lock()
+        self.batches_reduced = {}  # First frame of each batch that has been reduced but is not part of framesDone yet: its repeated frames
+        self.framesDone = start  # All frames before this one have been reduced
+        self.framesEnd = stop  # First frame that could not be read (stop if the file did not end early)
+        # Throughput counters
+        self.frames_decoded = 0
+        self.frames_reduced = 0
+        self.frames_repeated = 0  # Frames repeating the previous one, which were not reduced again
+        self.frames_allocated = 0  # Frames OpenCV had to allocate, as no buffer of the right size was free
+        self.seconds_decoding = 0.0  # Time spent in cap.read()
+        self.seconds_reducing = 0.0  # Time spent reducing frames, summed up over all reducer threads
+        self.seconds_decoderBlocked = 0.0  # Time the decoder waited for space in the queue: reducing is the bottleneck
+        self.seconds_reducersIdle = 0.0  # Time the reducers waited for frames, summed up: decoding is the bottleneck
+        self.timestamp_start = None
+
+    def start_threads(self):
+        self.timestamp_start = time.perf_counter()
+        self.decoder.start()
+        for reducer in self.reducers:
+            reducer.start()
+
+    def stop_threads(self):
+        self.is_stopped = True
+
+    def is_alive(self):
+        return self.decoder.is_alive() or any(reducer.is_alive() for reducer in self.reducers)
+
+    # Waits up to 'timeout' seconds for the pipeline to finish
+    def wait(self, timeout):
+        for thread in [self.decoder] + self.reducers:
+            if (thread.is_alive()):
+                thread.join(timeout)
+                return
+
+    def join(self, timeout=None):
+        self.decoder.join(timeout)
+        for reducer in self.reducers:
+            reducer.join(timeout)
+        if (self.error != None):
+            raise self.error
+
+    def put(self, item):
+        # Blocks while the queue is full, but keeps checking whether the pipeline got stopped
+        timestamp = time.perf_counter()
+        while not self.is_stopped:
+            try:
+                self.batches.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.seconds_decoderBlocked += time.perf_counter() - timestamp
+
+    def run_decoder(self):
+        repeats = RepeatDetector(is_copied=False)
+        held = None  # Buffer of the previous frame that the reducers already handed back, returned to the pool once the next frame differs
+        try:
+            for first in range(self.start, self.stop, self.batch_size):
+                frames = []
+                timestamp = time.perf_counter()
+                for i in range(first, min(first + self.batch_size, self.stop)):
+                    try:
+                        buffer = self.buffers.get_nowait()
+                        if (buffer is repeats.previous):
+                            held = buffer
+                            buffer = self.buffers.get_nowait()
+                    except queue.Empty:
+                        buffer = None
+                    # OpenCV decodes into the buffer if it matches the frame's size, else it allocates a new frame
+                    is_validFrame, frame = self.cap.read(buffer)
+                    if not is_validFrame:
+                        self.framesEnd = i
+                        break
+                    if (frame is not buffer):
+                        self.frames_allocated += 1
+                    if (repeats.is_repeated(frame)):
+                        self.frames_repeated += 1
+                        self.buffers.put(frame)
+                        frame = None
+                    elif (held is not None):
+                        self.buffers.put(held)
+                        held = None
+                    frames.append(frame)
+                    if (self.timestamps is not None):
+                        self.timestamps[i] = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                self.seconds_decoding += time.perf_counter() - timestamp
+                self.frames_decoded += len(frames)
+                if (frames):
+                    self.put((first, frames))
+                if (self.is_stopped or self.framesEnd < self.stop):
+                    break
+        except Exception as error:
+            self.error = error
+            self.is_stopped = True
+        finally:
+            # One end marker for each reducer thread
+            for reducer in self.reducers:
+                self.batches.put(None)
+
+    def run_reducer(self):
+        reducer = FrameReducer(self.tile_grid, is_repeatChecked=False, width=self.width)
+        while True:
+            timestamp = time.perf_counter()
+            item = self.batches.get()
+            timestamp_got = time.perf_counter()
+            if (item == None):
+                break
+            if (self.is_stopped):
+                continue  # Drain the queue so the decoder does not block
+            first, frames = item
+            try:
+                for i in range(0, len(frames)):
+                    if (frames[i] is None):
+                        continue  # Repeats the previous frame
+                    self.brightness[:, first + i] = reducer.reduce(frames[i])
+                    if (self.tile_grid > 0):
+                        self.tiles[:, first + i] = reducer.reduce_tiles(frames[i])
+                    self.buffers.put(frames[i])
+            except Exception as error:
+                self.error = error
+                self.is_stopped = True
+                continue
+            with self.lock:
+                self.seconds_reducersIdle += timestamp_got - timestamp
+                self.seconds_reducing += time.perf_counter() - timestamp_got
+                self.frames_reduced += len(frames)
+                # Batches may finish out of order, framesDone only covers the ones without gaps before them
+                self.batches_reduced[first] = [first + i for i in range(0, len(frames)) if frames[i] is None]
+                while (self.framesDone in self.batches_reduced):
+                    # All frames before the batch are done, so the values of its repeated frames are known now
+                    for i in self.batches_reduced.pop(self.framesDone):
+                        self.brightness[:, i] = self.brightness[:, i - 1]
+                        if (self.tile_grid > 0):
+                            self.tiles[:, i] = self.tiles[:, i - 1]
+                    self.framesDone = min(self.framesDone + self.batch_size, self.framesEnd)
+
+    # Throughput counters, to tell whether decoding or reducing the frames limits the speed of a scan
+    def get_stats(self):
+        seconds = time.perf_counter() - self.timestamp_start if self.timestamp_start != None else 0.0
+        with self.lock:
+            stats = {"framesDecoded": self.frames_decoded, "framesReduced": self.frames_reduced, "framesRepeated": self.frames_repeated, "framesAllocated": self.frames_allocated, "seconds": seconds,
+                     "decodeFps": self.frames_decoded / self.seconds_decoding if self.seconds_decoding > 0 else 0.0,
+                     "reduceFps": self.frames_reduced / self.seconds_reducing * len(self.reducers) if self.seconds_reducing > 0 else 0.0,
+                     "totalFps": self.frames_reduced / seconds if seconds > 0 else 0.0,
+                     "secondsDecoding": self.seconds_decoding, "secondsReducing": self.seconds_reducing,
+                     "secondsDecoderBlocked": self.seconds_decoderBlocked, "secondsReducersIdle": self.seconds_reducersIdle / len(self.reducers)}
+        stats["bottleneck"] = "reducing" if stats["secondsDecoderBlocked"] > stats["secondsReducersIdle"] else "decoding"
+        return stats
+
+
+# Opens a video file so the next read returns frame 'start' and returns the capture plus the position it reported
+# Without 'is_seekAllowed', the capture is not seeked but skips all frames up to 'start' instead (slow, but always exact)
+def open_capture(file_path, start, is_seekAllowed=True):
+    cap = cv2.VideoCapture(file_path)
+    if (start > 0):
+        if (is_seekAllowed):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        else:
+            for i in range(0, start):
+                if not cap.grab():
+                    break
+    return cap, int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+
+# Reads up to 'count' frames and returns their 5 brightness values each, followed by their tile means if the reducer
+# has a tile grid. Stops early at the end of the file or, in a worker process, as soon as the main process requests
+# to cancel the scan. The time of each frame (in seconds) is appended to 'timestamps' if given.
+# All frames are decoded into the same buffer.
+def read_frames(cap, reducer, count, timestamps=None):
+    values = numpy.zeros((5 + 2 * reducer.tile_grid * reducer.tile_grid, count))
+    frame = None
+    for i in range(0, count):
+        if (scan_cancelEvent != None and scan_cancelEvent.is_set()):
+            return values[:, :i]
+        is_validFrame, frame = cap.read(frame)
+        if not is_validFrame:
+            return values[:, :i]
+        if (timestamps != None):
+            timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+        values[:5, i] = reducer.reduce(frame)
+        if (reducer.tile_grid > 0):
+            values[5:, i] = reducer.reduce_tiles(frame)
+    return values
+
+
+def init_scanWorker(cancel_event):
+    global scan_cancelEvent
+    scan_cancelEvent = cancel_event
+
+
+# Reads frames start...stop-1 of a video file and returns the position the capture reported, their 5 brightness values
+# and their times. Runs in a separate process, so it opens its own capture. Another 'overlap' frames past 'stop' are read as well.
+def scan_chunk(file_path, start, stop, overlap=0, is_seekAllowed=True, tile_grid=0, width=0):
+    cap, position = open_capture(file_path, start, is_seekAllowed)
+    timestamps = []
+    values = read_frames(cap, FrameReducer(tile_grid, width=width), stop - start + overlap, timestamps)
+    cap.release()
+    return position, values, numpy.array(timestamps, dtype=numpy.float32)
+
+
+# Checks whether a chunk really starts at frame 'start': the capture has to report the requested position after seeking,
+# and the chunk's first frames have to match the frames the previous chunk read past its end ('tail')
+# Values restored from a cache file have been rounded to float32, so they need a larger tolerance ('atol')
+def is_chunkAligned(start, position, values, tail, atol=1e-6):
+    if (position != start):
+        return False
+    count = min(len(tail[0]), len(values[0]))
+    if (count < min(seek_overlap, len(values[0]))):
+        return False  # The previous chunk ended early, so there is nothing to compare against
+    return numpy.allclose(tail[:, :count], values[:len(tail), :count], rtol=0, atol=atol)
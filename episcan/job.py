@@ -0,0 +1,729 @@
+# -*- coding: utf-8 -*-
+"""
+Table 'brightness' contains the raw brightness values split into 5 lines:
+1. line (0): The absolute brightness for each frame
+2. line (1): The perceived brightness for each frame (thx D. Finley, alienryderflex.com/hsp.html)
+3. line (2): The R-channels brightness for each frame
+4. line (3): The G-channels brightness for each frame
+5. line (4): The B-channels brightness for each frame
+Table 'brightnessAbsolute' contains statistics across X lines, X being the max span according to settings
+1. line (0): The absolute brightness changes across 2 neighboring frames (starting with the first)
+2. line (1): The absolute brightness changes across 3 neighboring frames (starting with the first)
+3. line (2): The absolute brightness changes across 4 neighboring frames (starting with the first) and so on
+Table 'brightnessPerceived' does the same but uses the perceived instead of actual brightness as base data
+Table 'brightnessChannelR' does the same but uses the R-channel only as base data
+Table 'brightnessChannelG' does the same but uses the R-channel only as base data
+Table 'brightnessChannelB' does the same but uses the R-channel only as base data
+Table 'tiles' is only filled if a tile grid of n x n is set. Each frame is split into n x n tiles, and the table holds
+the luminance of every tile (lines 0...n*n-1, row by row) followed by their R-channel brightness, as uint8 values
+Table 'brightnessTiles' holds the statistics across frame spans of the tile that changed most at each frame
+The tables of statistics are SpanTables: each line is only calculated once it is requested, so memory scales with
+the lines actually viewed instead of the frame span
+"""
+import collections
+import concurrent.futures
+import multiprocessing
+import sqlite3
+import time
+
+import cv2
+import numpy
+
+from .cache import cache_suffix, import_csvCache, load_cache, load_cacheTiles, load_cacheTimestamps, metrics_all, save_cache
+from .catalog import Catalog
+from .extract import FramePipeline, FrameReducer, init_scanWorker, is_chunkAligned, open_capture, read_frames, scan_chunk, seek_overlap
+from .prescan import extract_coarseToFine
+from .profiler import StageProfiler
+from .spans import SpanTable, TileSpanTable
+from .stream import StreamDetector, print_event, summary_thresholds
+
+types = [] # Holds the names for all methods to analyse the data, used to match the type
+types.append("Absolute brightness")  # String for method 1
+types.append("Perceived brightness")  # String for method 2
+types.append("R,G,B as separate channels")  # String for method 3
+types.append("Worst tile (luminance and red)")  # String for method 4
+type_metrics = [0b00001, 0b00010, 0b11100, 0b00000]  # Lines of table 'brightness' each method is based on (method 4 uses the tiles)
+
+
+class Job:
+    def __init__(self):
+        self.file_path = "" # Path to the current job's video file
+        self.file_path_old = "" # Path to the previously processed video file
+        self.job_type = ""
+        self.is_silent_mode = False
+        self.set_type(1)  # The currently selected method how brightness should be handled (1...4 are valid)
+        self.set_fps(0)
+        self.set_isResetForced(True)  # Should all cached data be deleted instead of reused?
+        self.brightness = numpy.zeros((5, 2))  # The array containing all resulting raw data
+        self.metrics = metrics_all  # Bitmap of the lines of 'brightness' holding data, fewer if restored from an old CSV file
+        self.brightnessAbsolute = SpanTable(numpy.zeros(2), 2)
+        self.brightnessPerceived = SpanTable(numpy.zeros(2), 2)
+        self.brightnessChannelR = SpanTable(numpy.zeros(2), 2)
+        self.brightnessChannelG = SpanTable(numpy.zeros(2), 2)
+        self.brightnessChannelB = SpanTable(numpy.zeros(2), 2)
+        self.brightnessTiles = SpanTable(numpy.zeros(2), 2)
+        self.tiles = None  # The means of each tile per frame, None if the tile grid is off
+        self.timestamps = None  # Time of each frame in seconds as reported by the video file, None if unknown (see get_frameTimes)
+        self.is_analyzed = [False, False, False, False]  # Was an analysis already completed? (Array of booleans)
+        self.set_extracted(False)  # Have all frames of the current file been read?
+        self.set_framesDone(0)  # Number of leading frames of the current file that have been read so far
+        self.exactFrames = None  # After a fast scan: which frames hold exact values (True) and which ones are estimated
+        self.set_checkpointInterval(30)  # Seconds between saving the progress of a running scan to the cache file
+        self.set_reducerCount(2)  # Number of threads reducing decoded frames to their brightness values
+        self.set_queueSize(4)  # Number of batches of decoded frames waiting to be reduced, at most
+        self.set_decodeWidth(0)  # Width in pixels wider frames are shrunk to right after decoding (0 = full resolution)
+        self.pipelineStats = {}  # Throughput counters of the last scan
+        self.profiler = StageProfiler()  # Time spent in each stage, frames per second and peak memory of the last run
+        self.set_profilePath(None)  # Where to save the profiler's results as JSON after each run (None = not saved)
+        self.set_tracePath(None)  # Where to save the stages of each run as a trace file (None = not saved)
+        self.timestampStart = 0.0  # Time the last run began (seconds since the epoch)
+        self.detector = None  # Follows the peaks of all metrics while frames are read
+        self.set_stopOnUnsafe(False)  # Stop reading the video file as soon as the verdict is "unsafe"?
+        self.set_onEvent(print_event)  # Called with each threshold crossing found while frames are read
+        self.set_running(False)  # Is the video file being scanned right now?
+        self.set_cancelRequested(False)  # Should the running scan stop as soon as possible?
+        self.set_cap(None)  # Contains all frames
+        self.set_frameSpan(20)  # Current frame width of the analysis span
+        self.set_workerCount(1)  # Number of processes scanning the video file in parallel (1 = single process)
+        self.set_chunkSize(2000)  # Number of frames handed to a process at once when scanning in parallel
+        self.set_tileGrid(0)  # Number of tiles per row and column each frame is split into (0 = off, needed for method 4)
+        self.set_fastScan(False)  # Sample the video first and only read its suspicious parts in full?
+        self.set_prescanStep(50)  # Fast scan: Distance between the runs of sampled frames
+        self.set_prescanWidth(160)  # Fast scan: Width in pixels the sampled frames are shrunk to
+        self.set_prescanThreshold(10)  # Fast scan: Change in brightness between samples that calls for reading a part in full
+        self.set_prescanPadding(10)  # Fast scan: Number of frames read in full before and after a suspicious change
+        self.set_catalogPath(None)  # Catalog of scanned videos to look up and add results to (None = cache files only)
+        self.set_plotMaxColors(20)  # Number of plots to be drawn if the analysis span exceeds 10
+        self.set_colorBorderValue(0.8)  # Value (0...1) at which the second color should be placed in the linear gradient
+        self.set_color1('#FF7000')  # Color 1 for 3-color linear gradient coloring of data plots
+        self.set_color2('#FF0000')  # Color 2 for 3-color linear gradient coloring of data plots
+        self.set_color3('#000000')  # Color 3 for 3-color linear gradient coloring of data plots
+        self.set_yLim(120)  # Maximum Y-Value for plots
+
+    def set_type(self, type):
+        self.type = type    # Type of the current job, int 1...4 are valid
+        # TODO: Maybe an enum would be simpler?
+
+    def set_fps(self, fps):
+        self.fps = fps  # frames per second for the current job
+
+    def set_isResetForced(self, is_forced):
+        self.is_resetForced = is_forced # Should all cached data be deleted instead of reused?
+
+    def set_cap(self, cap):
+        self.cap = cap  # Contains all frames
+
+    def set_workerCount(self, workerCount):
+        self.workerCount = workerCount  # Number of processes scanning the video file in parallel (1 = single process)
+
+    def set_chunkSize(self, chunkSize):
+        self.chunkSize = chunkSize  # Number of frames handed to a process at once when scanning in parallel
+
+    def set_tileGrid(self, tileGrid):
+        self.tileGrid = tileGrid  # Number of tiles per row and column each frame is split into (0 = off, needed for method 4)
+
+    def set_fastScan(self, is_fastScan):
+        self.is_fastScan = is_fastScan  # Sample the video first and only read its suspicious parts in full?
+
+    def set_prescanStep(self, step):
+        self.prescanStep = step  # Fast scan: Distance between the runs of sampled frames
+
+    def set_prescanWidth(self, width):
+        self.prescanWidth = width  # Fast scan: Width in pixels the sampled frames are shrunk to
+
+    def set_prescanThreshold(self, threshold):
+        self.prescanThreshold = threshold  # Fast scan: Change in brightness between samples that calls for reading a part in full
+
+    def set_prescanPadding(self, padding):
+        self.prescanPadding = padding  # Fast scan: Number of frames read in full before and after a suspicious change
+
+    def set_catalogPath(self, catalogPath):
+        self.catalogPath = catalogPath  # Catalog of scanned videos to look up and add results to (None = cache files only)
+
+    def set_frameSpan(self, frameSpan):
+        self.frameSpan = frameSpan  # Current frame width of the analysis span
+    
+    def set_plotMaxColors(self, plotMaxColors):
+        self.plotMaxColors = plotMaxColors  # Number of plots to be drawn if the analysis span exceeds 10
+
+    def set_colorBorderValue(self, colorBorderValue):
+        self.colorBorderValue = colorBorderValue  # Value (0...1) at which the second color should be placed in the linear gradient
+        
+    def set_color1(self, color):
+        self.color1 = color  # Color 1 for 3-color linear gradient coloring of data plots
+
+    def set_color2(self, color):
+        self.color2 = color  # Color 2 for 3-color linear gradient coloring of data plots
+
+    def set_color3(self, color):
+        self.color3 = color  # Color 3 for 3-color linear gradient coloring of data plots
+
+    def set_yLim(self, y_limit):
+        self.yLim = y_limit  # Maximum Y-Value for plots
+
+    def set_timestampStart(self):
+        self.timestampStart = time.time()   # Track the timestamp at which processing begins
+        self.profiler.reset()
+
+    def set_profilePath(self, profilePath):
+        self.profilePath = profilePath  # Where to save the profiler's results as JSON after each run (None = not saved)
+
+    def set_tracePath(self, tracePath):
+        self.tracePath = tracePath  # Where to save the stages of each run as a trace file (None = not saved)
+
+    def set_analyzed(self, type, is_analyzed):
+        self.is_analyzed[type] = is_analyzed    # Was an analysis already completed? (Array of booleans)
+
+    def set_extracted(self, is_extracted):
+        self.is_extracted = is_extracted    # Does 'brightness' hold all 5 values for every frame of the current file?
+
+    def set_framesDone(self, framesDone):
+        self.framesDone = framesDone    # Number of leading frames of the current file that have been read so far
+
+    def set_checkpointInterval(self, seconds):
+        self.checkpointInterval = seconds   # Seconds between saving the progress of a running scan to the cache file
+
+    def set_reducerCount(self, reducerCount):
+        self.reducerCount = reducerCount    # Number of threads reducing decoded frames to their brightness values
+
+    def set_decodeWidth(self, decodeWidth):
+        self.decodeWidth = decodeWidth  # Width in pixels wider frames are shrunk to right after decoding (0 = full resolution)
+
+    def set_queueSize(self, queueSize):
+        self.queueSize = queueSize  # Number of batches of decoded frames waiting to be reduced, at most
+
+    def set_stopOnUnsafe(self, is_stopOnUnsafe):
+        self.is_stopOnUnsafe = is_stopOnUnsafe  # Stop reading the video file as soon as the verdict is "unsafe"?
+
+    def set_onEvent(self, on_event):
+        self.onEvent = on_event  # Called with each threshold crossing found while frames are read
+
+    def set_running(self, is_running):
+        self.is_running = is_running    # Is the video file being scanned right now?
+
+    def set_cancelRequested(self, is_cancelRequested):
+        self.is_cancelRequested = is_cancelRequested    # Should the running scan stop as soon as possible?
+
+
+# Reports the progress of a job, limited to one report every 'interval' seconds. Every stage's first and last report
+# are passed on either way. Also estimates the time remaining in the current stage (in seconds, -1 if unknown), based on
+# the progress rate of the last 'window' seconds, so it adapts when the speed changes. 'rate' holds that progress rate.
+class ProgressReporter:
+    def __init__(self, callback, interval=0.25, window=10.0):
+        self.callback = callback  # Called with (task, current, total, eta)
+        self.interval = interval
+        self.window = window
+        self.task = None
+        self.samples = collections.deque()  # Time and progress of the reports within the last 'window' seconds
+        self.timestamp_report = 0.0
+        self.rate = 0.0  # Progress per second, e.g. frames per second
+
+    def __call__(self, task, current, total=100):
+        timestamp = time.monotonic()
+        if (task != self.task):
+            self.task = task
+            self.samples.clear()
+        elif (current < total and timestamp - self.timestamp_report < self.interval):
+            return
+        self.timestamp_report = timestamp
+        self.samples.append((timestamp, current))
+        while (len(self.samples) > 2 and timestamp - self.samples[0][0] > self.window):
+            self.samples.popleft()
+        timestamp_first, current_first = self.samples[0]
+        eta = -1.0
+        self.rate = 0.0
+        if (current > current_first and timestamp > timestamp_first):
+            self.rate = (current - current_first) / (timestamp - timestamp_first)
+            eta = max(0, total - current) / self.rate
+        self.callback(task, current, total, eta)
+
+
+# Opens the job's video file, determines number of frames and fps and restores cached results if available
+def open_job(job):
+    print("Load File " + str(job.file_path))
+    job.cap = cv2.VideoCapture(job.file_path)
+    if (not job.cap.isOpened()):
+        raise IOError("Could not open video file " + str(job.file_path))
+    job.frameCount = int(job.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    job.fps = job.cap.get(cv2.CAP_PROP_FPS)  # Not rounded, e.g. 23.976 fps would drift by 4 seconds per hour otherwise
+
+    # Check if the file has been analyzed before and cached results are available
+    with job.profiler.stage("cacheLoad"):
+        cached = load_cache(job.file_path, job.fps, job.frameCount)
+        if (cached == None):
+            cached = import_csvCache(job.file_path, job.fps, job.frameCount)
+    tiles = None
+    timestamps = load_cacheTimestamps(job.file_path, job.frameCount) if cached != None else None
+    if (cached != None and job.tileGrid > 0):
+        tiles = load_cacheTiles(job.file_path, job.frameCount, job.tileGrid)
+        if (tiles is None):
+            print("Cached data for " + job.file_path + " holds no tiles of a " + str(job.tileGrid) + "x" + str(job.tileGrid) + " grid, ignoring it")
+            cached = None
+    if (cached == None and job.catalogPath != None):
+        # The video may have been scanned at another location, or its cache file could not be written
+        scan = load_catalogScan(job)
+        if (scan != None and (job.tileGrid == 0 or scan[1] is not None)):
+            print("Catalog " + job.catalogPath + " holds data for " + job.file_path)
+            cached = (numpy.array(scan[0]), metrics_all, job.frameCount)
+            tiles = numpy.array(scan[1]) if scan[1] is not None else None
+            timestamps = scan[2]
+    if (cached != None and cached[1] != 0 and cached[2] >= job.frameCount):
+        job.brightness = cached[0]
+        job.metrics = cached[1]
+        job.tiles = tiles
+        job.timestamps = timestamps
+        print("Cached data for " + job.file_path + " found, restoring data...")
+        if (job.metrics != metrics_all):
+            print("Cached data for " + job.file_path + " lacks some metrics, analysis modes based on them read the video file again")
+        # Only the raw values are cached, statistics across frame spans are calculated again
+        clear_spanTables(job)
+        job.set_extracted(True)
+        job.set_framesDone(job.frameCount)
+        job.exactFrames = None
+    elif (cached != None and cached[1] == metrics_all and cached[2] > 0):
+        # An earlier scan of this file got interrupted, continue where its last checkpoint left off
+        job.brightness = numpy.array(cached[0], dtype=numpy.float64)
+        job.metrics = metrics_all
+        job.tiles = numpy.array(tiles) if tiles is not None else None
+        job.timestamps = numpy.array(timestamps) if timestamps is not None else numpy.zeros(job.frameCount, dtype=numpy.float32)
+        print("Checkpoint for " + job.file_path + " found, resuming scan at frame " + str(cached[2]))
+        clear_spanTables(job)
+        job.set_extracted(False)
+        job.set_framesDone(cached[2])
+        job.exactFrames = None
+    else:
+        print("No complete cached data for " + job.file_path + " found. Will have to analyze file")
+
+        # Check if a new file has been selected, so old data has to be purged. Estimated values of a fast scan are never reused.
+        if (job.file_path_old != job.file_path or job.is_resetForced or job.cap == None or len(job.brightness[0]) != int(job.cap.get(cv2.CAP_PROP_FRAME_COUNT)) or job.exactFrames is not None or (0 if job.tiles is None else len(job.tiles)) != 2 * job.tileGrid * job.tileGrid or job.metrics != metrics_all):
+            clear_data(job)
+
+
+# Replaces all values collected from the video file with empty ones, so it has to be read again from the start
+def clear_data(job):
+    job.brightness = numpy.zeros((5, job.frameCount))
+    job.metrics = metrics_all
+    job.tiles = numpy.zeros((2 * job.tileGrid * job.tileGrid, job.frameCount), dtype=numpy.uint8) if job.tileGrid > 0 else None
+    job.timestamps = numpy.zeros(job.frameCount, dtype=numpy.float32)
+    clear_spanTables(job)
+    job.set_extracted(False)
+    job.set_framesDone(0)
+    job.exactFrames = None
+
+
+# Does 'brightness' hold the lines the job's analysis mode is based on?
+def has_typeMetrics(job):
+    return type_metrics[job.type - 1] & ~job.metrics == 0
+
+
+# Replaces all tables of statistics across frame spans with empty ones, matching the job's frame count
+def clear_spanTables(job):
+    empty = numpy.zeros(job.frameCount)
+    job.brightnessAbsolute = SpanTable(empty, job.frameSpan)
+    job.brightnessPerceived = SpanTable(empty, job.frameSpan)
+    job.brightnessChannelR = SpanTable(empty, job.frameSpan)
+    job.brightnessChannelG = SpanTable(empty, job.frameSpan)
+    job.brightnessChannelB = SpanTable(empty, job.frameSpan)
+    job.brightnessTiles = SpanTable(empty, job.frameSpan)
+    job.is_analyzed = [False, False, False, False]
+
+
+# Step 1: Collects the brightness values of all frames unless they are known already. Returns False if aborted.
+def extract_job(job, report):
+    if (job.is_extracted and not has_typeMetrics(job)):
+        # Restored from an old CSV file, which lacks the values this analysis mode is based on
+        print("Cached data for " + job.file_path + " lacks the values of analysis mode " + str(job.type) + ", reading the video file again")
+        job.cap.release()
+        job.cap = cv2.VideoCapture(job.file_path)
+        clear_data(job)
+
+    # All analysis modes share a single pass over the video file
+    if (job.is_extracted):
+        print("All frames have been read before, no need to read the video file again")
+        return True
+
+    if (job.is_fastScan):
+        job.detector = None  # Estimated values would only produce estimated crossings
+        is_extracted = extract_coarseToFine(job, report)
+        if (is_extracted == False):
+            report("Step 1/2 aborted", job.framesDone, job.frameCount)
+            return False
+        if (is_extracted == True):
+            # Estimated values are not written to the cache file, it only ever holds exact ones
+            report("Step 1/2 completed (fast scan, not cached)", job.frameCount, job.frameCount)
+            job.set_extracted(True)
+            return True
+        # Most of the video is suspicious, it is read in full like in a normal scan
+
+    job.profiler.reset_rate()
+    # Threshold crossings are reported while frames are still being read. All metrics are followed, so the verdict and
+    # stopping on unsafe flashing do not depend on the selected analysis mode.
+    tile_count = len(job.tiles) if job.tiles is not None else 0
+    job.detector = StreamDetector(job.frameSpan, job.fps, 0, on_event=job.onEvent, tile_count=tile_count)
+    if (job.workerCount > 1):
+        extract_brightnessParallel(job, report)
+    else:
+        extract_brightness(job, report)
+
+    if (not job.is_extracted):
+        # Aborted, the progress so far is kept as a checkpoint in the cache file
+        save_checkpoint(job)
+        if (job.is_stopOnUnsafe and job.detector.is_unsafe):
+            report("Step 1/2 stopped early, flashing above " + str(job.detector.stop_threshold) + " found", job.framesDone, job.frameCount)
+        else:
+            report("Step 1/2 aborted, progress saved", job.framesDone, job.frameCount)
+        return False
+    job.detector.flush()
+
+    # Step 1 completed, data from all frames has been collected
+    report("Step 1/2 completed, pushing data to file...", job.frameCount, job.frameCount)
+
+    # Save the job.brightness array to the cache file
+    print("Saving data to: " + job.file_path + cache_suffix)
+    save_checkpoint(job)
+    if (job.catalogPath != None):
+        save_catalogScan(job)
+    return True
+
+
+def extract_brightness(job, report):
+    # Collect all 5 values of job.brightness in a single pass over the video frames
+    start = job.framesDone
+    if (start > 0):
+        # Resuming an interrupted scan: Seek a few frames before the checkpoint and verify those frames against
+        # the restored values, as some codecs can only seek to keyframes. If they differ, skip frames without seeking.
+        job.cap.release()
+        first = max(0, start - seek_overlap)
+        job.cap, position = open_capture(job.file_path, first)
+        values = read_frames(job.cap, FrameReducer(width=job.decodeWidth), start - first)
+        if (not is_chunkAligned(first, position, values, job.brightness[:, first:start], atol=1e-3)):
+            print("WARNING: Seeking to frame " + str(first) + " is inaccurate (reported " + str(position) + "), skipping frames without seeking")
+            job.cap.release()
+            job.cap, position = open_capture(job.file_path, start, is_seekAllowed=False)
+
+    # Decoding and determining absolute, perceived and R, G, B brightness of each frame run on background threads
+    pipeline = FramePipeline(job.cap, job.brightness, start, job.frameCount, job.reducerCount, job.queueSize, tiles=job.tiles, timestamps=job.timestamps, width=job.decodeWidth)
+    pipeline.start_threads()
+    last_checkpoint = time.monotonic()
+    while (pipeline.is_alive()):
+        pipeline.wait(0.1)
+        job.set_framesDone(pipeline.framesDone)
+        job.profiler.count_frames(job.framesDone)
+        feed_detector(job)
+
+        # Track progress
+        report("Step 1/2 (collecting data)", job.framesDone, job.frameCount)
+        if (job.is_cancelRequested):
+            pipeline.stop_threads()
+        elif (time.monotonic() - last_checkpoint >= job.checkpointInterval):
+            save_checkpoint(job)
+            last_checkpoint = time.monotonic()
+    pipeline.join()
+    job.set_framesDone(pipeline.framesDone)
+
+    job.pipelineStats = pipeline.get_stats()
+    job.profiler.add_stage("decode", job.pipelineStats["secondsDecoding"])
+    job.profiler.add_stage("reduce", job.pipelineStats["secondsReducing"])  # Summed up over all reducer threads
+    print("Pipeline: decoded " + str(int(job.pipelineStats["decodeFps"])) + " frames/s, reduced " + str(int(job.pipelineStats["reduceFps"])) + " frames/s using " + str(len(pipeline.reducers)) + " threads, " + str(int(job.pipelineStats["totalFps"])) + " frames/s overall, " + str(job.pipelineStats["framesRepeated"]) + " repeated frames skipped. Bottleneck: " + job.pipelineStats["bottleneck"])
+    if (job.is_cancelRequested):
+        return
+    if (pipeline.framesEnd < job.frameCount):
+        # Checking for unexpected EoF
+        print("No next frame found after frame " + str(pipeline.framesEnd))
+
+    job.set_framesDone(job.frameCount)
+    job.set_extracted(True)
+
+
+def extract_brightnessParallel(job, report):
+    # Split the video into chunks of frames, each read by a separate process seeking to the chunk's first frame
+    # When resuming, the first chunk starts a few frames before the checkpoint, so its seek can be verified as well
+    resume = job.framesDone
+    first = max(0, resume - seek_overlap)
+    chunks = [(start, min(start + job.chunkSize, job.frameCount)) for start in range(first, job.frameCount, job.chunkSize)]
+    results = [None] * len(chunks)
+    print("Reading " + str(len(chunks)) + " chunks of up to " + str(job.chunkSize) + " frames using " + str(job.workerCount) + " processes")
+
+    frames_read = resume
+    next_chunk = 0  # Chunks are put back together in order, so every checkpoint covers all frames before it
+    last_checkpoint = time.monotonic()
+    context = multiprocessing.get_context("spawn")
+    cancel_event = context.Event()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=job.workerCount, mp_context=context, initializer=init_scanWorker, initargs=(cancel_event,)) as executor:
+        futures = {}
+        for k in range(0, len(chunks)):
+            futures[executor.submit(scan_chunk, job.file_path, chunks[k][0], chunks[k][1], seek_overlap, True, job.tileGrid, job.decodeWidth)] = k
+        pending = set(futures)
+        while pending:
+            done, pending = concurrent.futures.wait(pending, timeout=0.1)
+            for future in done:
+                if (not future.cancelled()):
+                    k = futures[future]
+                    results[k] = future.result()
+                    frames_read += chunks[k][1] - chunks[k][0]
+
+            # Chunks finishing after an abort may be incomplete and are dropped
+            while (not job.is_cancelRequested and next_chunk < len(chunks) and results[next_chunk] != None):
+                stitch_chunk(job, chunks, results, next_chunk, resume)
+                job.set_framesDone(chunks[next_chunk][1])
+                next_chunk += 1
+            feed_detector(job)
+            if (time.monotonic() - last_checkpoint >= job.checkpointInterval):
+                save_checkpoint(job)
+                last_checkpoint = time.monotonic()
+
+            # Track progress
+            job.profiler.count_frames(frames_read)
+            report("Step 1/2 (collecting data)", min(frames_read, job.frameCount), job.frameCount)
+            if (job.is_cancelRequested and not cancel_event.is_set()):
+                # Running workers stop after their current frame, chunks not started yet are dropped
+                cancel_event.set()
+                for future in pending:
+                    future.cancel()
+
+    if (not job.is_cancelRequested):
+        job.set_framesDone(job.frameCount)
+        job.set_extracted(True)
+
+
+# Passes all frames read since the last call on to the job's detector. If the verdict turns "unsafe" and the job
+# should stop then, the scan is cancelled like an abort, so the progress so far is saved as a checkpoint.
+def feed_detector(job):
+    for i in range(job.detector.frames, job.framesDone):
+        values = job.brightness[:, i] if job.tiles is None else numpy.concatenate((job.brightness[:, i], job.tiles[:, i]))
+        job.detector.push(values, float(job.timestamps[i]) if job.timestamps is not None else None)
+    if (job.is_stopOnUnsafe and job.detector.is_unsafe and not job.is_cancelRequested):
+        print("Flashing above " + str(job.detector.stop_threshold) + " found at " + str(round(job.detector.peak_seconds, 2)) + " s, stopping scan early")
+        job.set_cancelRequested(True)
+
+
+# Puts chunk k back into job.brightness. Some codecs can only seek to keyframes, so every seek gets verified
+# against the frames the previous chunk read past its end. Misaligned chunks are read again without seeking.
+def stitch_chunk(job, chunks, results, k, resume):
+    start, stop = chunks[k]
+    position, values, timestamps = results[k]
+    if (k > 0):
+        tail = results[k - 1][1][:, chunks[k - 1][1] - chunks[k - 1][0]:]
+        is_aligned = is_chunkAligned(start, position, values, tail)
+    elif (start > 0):
+        # First chunk of a resumed scan, compare with the frames restored from the checkpoint
+        is_aligned = is_chunkAligned(start, position, values, job.brightness[:, start:resume], atol=1e-3)
+    else:
+        is_aligned = True
+    if (not is_aligned):
+        print("WARNING: Seeking to frame " + str(start) + " is inaccurate (reported " + str(position) + "), reading chunk again without seeking")
+        results[k] = scan_chunk(job.file_path, start, stop, seek_overlap, is_seekAllowed=False, tile_grid=job.tileGrid, width=job.decodeWidth)
+        position, values, timestamps = results[k]
+    count = min(stop - start, len(values[0]))
+    job.brightness[:, start:start + count] = values[:5, :count]
+    if (job.timestamps is not None):
+        job.timestamps[start:start + count] = timestamps[:count]
+    if (job.tiles is not None):
+        job.tiles[:, start:start + count] = values[5:, :count]
+    if (count < stop - start):
+        print("No next frame found after frame " + str(start + count))
+
+
+# Saves all frames read so far to the cache file, marking it as a checkpoint if the scan has not completed yet
+def save_checkpoint(job):
+    try:
+        with job.profiler.stage("cacheSave"):
+            save_cache(job.file_path, job.brightness, job.fps, job.frameCount, frames_done=job.framesDone, tiles=job.tiles, timestamps=job.timestamps)
+    except OSError as error:
+        print("WARNING: Could not save cached data: " + str(error))
+
+
+# Step 2: Calculates the statistics across frame spans for the job's analysis mode. Returns True if there is data to plot.
+def analyze_job(job, report):
+    # The tables are kept across analyses. Whenever the collected data changes (another file, a new scan, data restored
+    # from a cache), they are cleared along with it (see clear_spanTables). Tables of another length are left over.
+    tables = [job.brightnessAbsolute, job.brightnessPerceived, job.brightnessChannelR, job.brightnessChannelG, job.brightnessChannelB, job.brightnessTiles]
+    if (any(table.frame_count != len(job.brightness[0]) for table in tables)):
+        print("set brightness data arrays to appropriate size")
+        clear_spanTables(job)
+    else:
+        print("cached data looks good, will not be deleted")
+
+    # If only the frame span changed, the tables are resized in place: lines calculated before stay valid
+    for table in [job.brightnessAbsolute, job.brightnessPerceived, job.brightnessChannelR, job.brightnessChannelG, job.brightnessChannelB, job.brightnessTiles]:
+        if (len(table) != job.frameSpan):
+            print("Frame span changed from " + str(len(table)) + " to " + str(job.frameSpan) + ", resizing table")
+            table.set_frameSpan(job.frameSpan)
+
+    for i in range(0, len(job.is_analyzed)):
+        print("DEBUG: is_analyzed[" + str(i) + "] is " + str(job.is_analyzed[i]))
+
+    # Check if processing is even necessary
+    if (job.cap == None):
+        print("No video file has been selected. Returning.")
+        return False
+
+    print("job.brightnessAbsolute is of size " + str(len(job.brightnessAbsolute)) + "x" + str(len(job.brightnessAbsolute[0])))
+
+    if (job.is_analyzed[job.type - 1] == True):
+        # Report current status
+        print("Cached data found, no new analysis necessary.")
+        report("Step 2/2 (processing CACHED data)", len(job.brightness[0]), len(job.brightness[0]))
+        return True
+
+    # Report current status
+    report("Step 2/2 (analyzing data) begins...", 0)
+
+    # Create separate statistics for each frame span
+    print("DEBUG: Frame spans in which brightness changes will be calculated) are 2..." + str(job.frameSpan) + " (max value, 'frame_span')")
+    # Absolute job.brightness analysis
+    if (job.type == 1):
+        job.brightnessAbsolute = SpanTable(job.brightness[0], job.frameSpan, is_scaled=True)
+
+    # Perceived job.brightness analysis
+    elif (job.type == 2):
+        job.brightnessPerceived = SpanTable(job.brightness[1], job.frameSpan)
+
+    # Separate analysis for each channel
+    elif (job.type == 3):
+        job.brightnessChannelR = SpanTable(job.brightness[2], job.frameSpan)
+        job.brightnessChannelG = SpanTable(job.brightness[3], job.frameSpan)
+        job.brightnessChannelB = SpanTable(job.brightness[4], job.frameSpan)
+
+    # Worst tile analysis
+    elif (job.type == 4):
+        if (job.tiles is None):
+            print("ERROR: No tiles have been collected, set a tile grid and load the file again")
+            return False
+        job.brightnessTiles = TileSpanTable(job.tiles, job.frameSpan)
+
+    else:
+        print("ERROR: Unknown analysis mode selected: " + str(job.type))
+        return False
+
+    report("Step 2/2 (analyzing data)", job.frameCount, job.frameCount)
+
+    # Mark the analysis as completed - from now on cached data will be accessed
+    job.set_analyzed(job.type - 1, True)
+    print("done")
+    return True
+
+
+# Returns the tables of statistics across frame spans that belong to the job's analysis mode
+def get_spanTables(job):
+    if (job.type == 1):
+        return [job.brightnessAbsolute]
+    elif (job.type == 2):
+        return [job.brightnessPerceived]
+    elif (job.type == 3):
+        return [job.brightnessChannelR, job.brightnessChannelG, job.brightnessChannelB]
+    elif (job.type == 4):
+        return [job.brightnessTiles]
+    return []
+
+
+# Time each frame starts at in seconds, followed by the time the last one ends (frameCount + 1 values). The timestamps
+# reported by the video file are used once all frames have been read, so variable frame rates are shown correctly,
+# unless they are implausible (not increasing, e.g. all 0 for streams without them). Frame number / fps otherwise.
+def get_frameTimes(job):
+    fps = job.fps if job.fps > 0 else 1
+    times = numpy.arange(0, job.frameCount + 1) / fps
+    if (job.timestamps is not None and job.framesDone >= job.frameCount and job.frameCount > 1):
+        timestamps = numpy.asarray(job.timestamps, dtype=numpy.float64)
+        if (numpy.all(numpy.diff(timestamps) > 0)):
+            times[:-1] = timestamps
+            times[-1] = timestamps[-1] + 1 / fps
+    return times
+
+
+# Key figures of the job's current analysis mode: the highest change across all frame spans, when it happened
+# and for how many seconds the changes exceeded each of summary_thresholds. After a fast scan, 'secondsEstimated' tells
+# how much of the video was only sampled, so changes there may have been missed. Method 4 also tells the worst tile.
+def summarize_job(job):
+    tables = get_spanTables(job)
+    if (not tables or job.frameCount == 0):
+        return {"peak": 0.0, "peakSeconds": 0.0, "secondsAbove": {str(threshold): 0.0 for threshold in summary_thresholds}, "secondsEstimated": 0.0}
+    peaks = tables[0].peaks().copy()  # Highest value across all frame spans (and channels) starting at each frame
+    for table in tables[1:]:
+        numpy.maximum(peaks, table.peaks(), out=peaks)
+    times = get_frameTimes(job)
+    durations = numpy.diff(times)  # How long each frame is shown
+    summary = {"peak": float(peaks.max()), "peakSeconds": float(times[numpy.argmax(peaks)]), "secondsAbove": {}}
+    for threshold in summary_thresholds:
+        summary["secondsAbove"][str(threshold)] = float(durations[peaks > threshold].sum())
+    summary["secondsEstimated"] = 0.0
+    if (job.exactFrames is not None):
+        summary["secondsEstimated"] = float(durations[~job.exactFrames].sum())
+    if (job.type == 4):
+        # Where the worst tile was at the peak, counting rows and columns from the top left
+        tile = tables[0].find_worstTile(int(numpy.argmax(peaks)))
+        count = job.tileGrid * job.tileGrid
+        summary["worstTile"] = {"channel": "luminance" if tile < count else "red", "row": tile % count // job.tileGrid, "column": tile % job.tileGrid}
+    return summary
+
+
+# Runs a job from opening its video file (optional) up to the statistics across frame spans
+# Returns True if there is data to plot, False if the job got aborted or failed
+def run_job(job, report, is_loadRequested=True):
+    job.set_running(True)
+    if (is_loadRequested):
+        job.set_timestampStart()  # Analyzing the collected data again adds to the profile of the run that loaded it
+    try:
+        if (is_loadRequested):
+            with job.profiler.stage("open"):
+                open_job(job)
+        if (is_loadRequested or not has_typeMetrics(job)):
+            with job.profiler.stage("extract"):
+                if (not extract_job(job, report)):
+                    return False
+        with job.profiler.stage("analyze"):
+            return analyze_job(job, report)
+    finally:
+        job.set_running(False)
+        save_profile(job)
+
+
+# Returns table 'brightness' and the tile means of the job's video file from its catalog, or None if it holds no such data
+def load_catalogScan(job):
+    try:
+        with job.profiler.stage("catalogLoad"):
+            with Catalog(job.catalogPath) as catalog:
+                return catalog.load_scan(job.file_path, job.fps, job.frameCount, job.tileGrid)
+    except (OSError, sqlite3.Error) as error:
+        print("WARNING: Could not read catalog " + job.catalogPath + ": " + str(error))
+        return None
+
+
+# Adds the complete results of the job to its catalog, so they are found again after the video file has been moved
+def save_catalogScan(job):
+    try:
+        with job.profiler.stage("catalogSave"):
+            with Catalog(job.catalogPath) as catalog:
+                catalog.save_scan(job.file_path, job.brightness, job.fps, job.frameCount, tiles=job.tiles, timestamps=job.timestamps)
+    except (OSError, sqlite3.Error) as error:
+        print("WARNING: Could not add " + job.file_path + " to catalog " + job.catalogPath + ": " + str(error))
+
+
+# Saves the profiler's results of the job's last run, if the job has a path for them
+def save_profile(job):
+    try:
+        if (job.profilePath != None):
+            job.profiler.save_json(job.profilePath)
+        if (job.tracePath != None):
+            job.profiler.save_trace(job.tracePath)
+    except OSError as error:
+        print("WARNING: Could not save profile: " + str(error))
+
+
+def print_report(task, current, total, eta):
+    print(f"{task} - {current} of {total}" + (f", about {int(eta)} s left" if eta >= 0 and current < total else ""))
+
+
+# Headless entry point: Scans a single video file and returns the finished job, or None if the scan got aborted
+# 'settings' are applied through the job's setters, e.g. scan_file(path, frameSpan=40, workerCount=4)
+def scan_file(file_path, type=1, report=None, **settings):
+    job = Job()
+    job.file_path = file_path
+    job.set_type(type)
+    for name, value in settings.items():
+        getattr(job, "set_" + name)(value)
+    if (report == None):
+        report = ProgressReporter(print_report, interval=1.0)
+    if (not run_job(job, report)):
+        return None
+    return job
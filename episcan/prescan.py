@@ -0,0 +1,261 @@
+"""
+Fast scans: A cheap first pass samples the video at reduced resolution, then only its suspicious parts are read in full
+"""
+import time
+
+import cv2
+import numpy
+
+from .extract import FrameReducer, read_frames
+
+profile_rows = [0, 2, 3, 4]  # Absolute brightness and R, G, B channels are checked for changes, plus all tile means
+sample_length = 4  # Number of consecutive frames read at each sample position
+drift_frames = 10  # Changes between samples further apart may be proportionally larger, so slow fades do not count as suspicious
+seek_minDistance = 20  # Gaps shorter than this are always grabbed, OpenCV decodes about 16 frames before the target of a seek
+full_share = 0.5  # Share of the video the suspicious parts may cover, above it the whole video is read like in a normal scan
+window_readSize = 100  # Number of frames read at once in a window, between progress reports
+
+
+# Moves a capture forward through a video, either by seeking or by grabbing all frames in between, whichever is
+# faster. Grabbing decodes every frame, while a seek costs about as much as decoding a few dozen of them, so seeking
+# only pays off across long gaps. The time of both is measured as the video is read. Every seek is verified by the time
+# of the first frame read after it, if a seek lands on another frame, all further gaps are grabbed.
+class FrameSkipper:
+    def __init__(self, cap, file_path, fps):
+        self.cap = cap  # Has to be at frame 0, may be reopened
+        self.file_path = file_path
+        self.fps = fps if fps > 0 else 1
+        self.position = 0  # Next frame 'cap' returns
+        self.seconds_first = None  # Time of frame 0
+        self.seconds_frame = None  # Average time to grab or read one frame
+        self.seconds_seek = None  # Average time of a seek
+        self.is_seekAllowed = True
+        self.is_seeked = False  # The next frame read is the first one after a seek
+        self.seeks = 0
+
+    def add_time(self, average, seconds):
+        return seconds if average == None else 0.8 * average + 0.2 * seconds
+
+    # Lets the next read return frame 'target'. Returns False at the end of the file.
+    def skip_to(self, target):
+        gap = target - self.position
+        if (gap > 0 and self.is_seekAllowed and self.seconds_first != None and self.seconds_frame != None):
+            if (gap >= seek_minDistance if self.seconds_seek == None else self.seconds_seek < gap * self.seconds_frame):
+                timestamp = time.perf_counter()
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                self.seconds_seek = self.add_time(self.seconds_seek, time.perf_counter() - timestamp)
+                self.position = target
+                self.is_seeked = True
+                self.seeks += 1
+                return True
+        while (self.position < target):
+            timestamp = time.perf_counter()
+            if not self.cap.grab():
+                return False
+            self.seconds_frame = self.add_time(self.seconds_frame, time.perf_counter() - timestamp)
+            self.position += 1
+        return True
+
+    # Reads the next frame into 'frame' if possible, like cap.read()
+    def read(self, frame=None):
+        timestamp = time.perf_counter()
+        is_validFrame, frame = self.cap.read(frame)
+        if not is_validFrame:
+            return False, frame
+        self.seconds_frame = self.add_time(self.seconds_frame, time.perf_counter() - timestamp)
+        seconds = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if (self.seconds_first == None and self.position == 0):
+            self.seconds_first = seconds
+        if (self.is_seeked):
+            self.is_seeked = False
+            if (abs(seconds - self.seconds_first - self.position / self.fps) > 0.5 / self.fps):
+                print("WARNING: Seeking to frame " + str(self.position) + " is inaccurate (frame at " + str(round(seconds, 3)) + " s read), skipping frames without seeking")
+                self.is_seekAllowed = False
+                target = self.position
+                self.cap.release()
+                self.cap = cv2.VideoCapture(self.file_path)
+                self.position = 0
+                if not self.skip_to(target):
+                    return False, frame
+                return self.read(frame)
+        self.position += 1
+        return True, frame
+
+    # Starts over at frame 0, the times measured so far are kept
+    def rewind(self):
+        self.cap.release()
+        self.cap = cv2.VideoCapture(self.file_path)
+        self.position = 0
+        self.is_seeked = False
+
+    # Reads up to 'count' frames, see read_frames()
+    def read_frames(self, reducer, count, timestamps):
+        first = numpy.zeros((5 + 2 * reducer.tile_grid * reducer.tile_grid, 0))
+        if (self.is_seeked and count > 0):
+            # The first frame after a seek is read on its own, so the seek gets verified
+            is_validFrame, frame = self.read()
+            if not is_validFrame:
+                return first
+            timestamps.append(self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+            first = numpy.array(reducer.reduce(frame) + (tuple(reducer.reduce_tiles(frame)) if reducer.tile_grid > 0 else ()))[:, None]
+            count -= 1
+        values = read_frames(self.cap, reducer, count, timestamps)
+        self.position += len(values[0])
+        return numpy.concatenate((first, values), axis=1)
+
+
+# Returns the first frame of the run of sample_length frames sampled in each block of 'step' frames. The runs are
+# placed at random within their blocks, as a run at the same place in every block would line up with a strobe flashing
+# at a multiple of the block's rate and see the same part of each flash. The offsets are the same for every scan of a
+# video, the first run starts at frame 0.
+def get_sampleOffsets(frame_count, step):
+    offsets = numpy.random.default_rng(0).integers(0, max(1, step - sample_length + 1), frame_count // max(1, step) + 1)
+    offsets[0] = 0
+    return offsets
+
+
+# Tells for each sample whether the brightness, the color channels or, if there are any, the tile means change by more
+# than 'threshold' from it to the next one (more than threshold * gap / drift_frames across longer gaps)
+def find_suspiciousGaps(positions, values, threshold):
+    changes = numpy.abs(numpy.diff(values[profile_rows + list(range(5, len(values)))], axis=1)).max(axis=0)
+    return changes > threshold * numpy.maximum(1, numpy.diff(positions) / drift_frames)
+
+
+# Phase 1: Reads a run of sample_length frames in every block of 'step' frames (see get_sampleOffsets) and returns
+# their positions and 5 brightness values each, taken from a copy of the frame shrunk to 'width' pixels. The gaps in
+# between are skipped (see FrameSkipper). Sampled frames are all decoded into the same buffer.
+# The first frame of each run tells how the brightness developed since the last run, the others how much it changes
+# from one frame to the next. The tile means follow the 5 values if the job has a tile grid, the time of the frame
+# (in seconds) comes last, followed by the number of frames in gaps with changes above 'threshold'. Sampling stops early
+# once these cover more than full_share of the video, as reading all of it is faster then. Returns None if aborted.
+def sample_frames(job, report, skipper, step, width, threshold):
+    reducer = FrameReducer(job.tileGrid, width=width)
+    offsets = get_sampleOffsets(job.frameCount, step)
+    frame = None
+    positions = []
+    values = []
+    timestamps = []
+    suspicious = 0  # Number of frames in gaps with a change above 'threshold'
+    for block in range(0, len(offsets)):
+        first = block * step + int(offsets[block])
+        if (first >= job.frameCount or not skipper.skip_to(first)):
+            break
+        j = max(0, len(positions) - 1)  # Last sample before the run
+        for i in range(first, min(first + sample_length, job.frameCount)):
+            is_validFrame, frame = skipper.read(frame)
+            if not is_validFrame:
+                break
+            small = reducer.shrink(frame) if frame.shape[1] > width else frame  # The tiles are taken from it as well
+            positions.append(i)
+            timestamps.append(skipper.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+            values.append(numpy.concatenate((reducer.reduce(small), reducer.reduce_tiles(small))) if job.tileGrid > 0 else reducer.reduce(small))
+        if (len(positions) - j >= 2):
+            is_suspicious = find_suspiciousGaps(numpy.array(positions[j:]), numpy.array(values[j:], dtype=numpy.float64).T, threshold)
+            suspicious += int(numpy.diff(positions[j:])[is_suspicious].sum())
+        report("Step 1/2 (fast scan, sampling)", first, job.frameCount)
+        if (job.is_cancelRequested):
+            return None
+        if (suspicious > full_share * job.frameCount):
+            break
+    return numpy.array(positions, dtype=numpy.int64), numpy.array(values, dtype=numpy.float64).reshape(-1, 5 + 2 * job.tileGrid * job.tileGrid).T, numpy.array(timestamps), suspicious
+
+
+# Returns the windows (start, stop) of frames that have to be read in full: wherever the samples changed by more than
+# 'threshold' from one to the next (see find_suspiciousGaps), plus 'padding' frames on either side. Windows start at
+# a sample and overlapping windows are merged.
+def find_windows(positions, values, frame_count, threshold, padding):
+    windows = []
+    if (len(positions) < 2):
+        return [(0, frame_count)] if frame_count > 0 else []
+    for j in numpy.flatnonzero(find_suspiciousGaps(positions, values, threshold)):
+        start = int(positions[max(0, numpy.searchsorted(positions, int(positions[j]) - padding, side="right") - 1)])
+        stop = min(frame_count, int(positions[j + 1]) + padding + 1)
+        if (windows and start <= windows[-1][1]):
+            windows[-1] = (windows[-1][0], max(windows[-1][1], stop))
+        else:
+            windows.append((start, stop))
+    return windows
+
+
+# Phase 2: Reads all frames of the windows into job.brightness and marks them in 'exact'. A window grows by another
+# 'padding' frames as long as the brightness at its end still changes by more than 'threshold' from frame to frame,
+# as the samples may have caught only the beginning of a flashing sequence. Returns False if aborted.
+def extract_windows(job, report, skipper, windows, threshold, padding, exact):
+    timestamps = []
+    reducer = FrameReducer(job.tileGrid, width=job.decodeWidth)
+    frames_total = sum(stop - start for start, stop in windows)
+    frames_read = 0
+    skipper.rewind()
+    for start, stop in windows:
+        start = max(start, skipper.position)  # The previous window may have grown into this one
+        if (start >= stop or exact[start:stop].all()):
+            continue
+        if not skipper.skip_to(start):
+            break  # End of file
+        while (skipper.position < stop):
+            position = skipper.position
+            timestamps.clear()
+            block = skipper.read_frames(reducer, min(stop - position, window_readSize), timestamps)
+            count = len(block[0])
+            job.brightness[:, position:position + count] = block[:5]
+            job.timestamps[position:position + count] = timestamps
+            if (job.tiles is not None):
+                job.tiles[:, position:position + count] = block[5:]
+            exact[position:position + count] = True
+            frames_read += count
+            if (count == 0):
+                break  # End of file
+            if (skipper.position >= stop and stop < job.frameCount):
+                tail = job.brightness[profile_rows, max(0, stop - padding - 1):stop]
+                if (job.tiles is not None):
+                    tail = numpy.concatenate((tail, job.tiles[:, max(0, stop - padding - 1):stop]))
+                if (numpy.abs(numpy.diff(tail, axis=1)).max() > threshold):
+                    stop = min(job.frameCount, stop + padding)
+                    frames_total += stop - skipper.position
+            report("Step 1/2 (fast scan, reading suspicious parts)", frames_read, max(frames_read, frames_total))
+            if (job.is_cancelRequested):
+                return False
+    return True
+
+
+# Collects estimated brightness values of all frames in two phases, reading only the suspicious parts of the video
+# in full. Afterwards, job.exactFrames tells which frames hold exact values and which ones were interpolated
+# between samples. Frames restored from a checkpoint are exact already and kept. Returns False if aborted and None if
+# the suspicious parts cover most of the video, so it is faster to read all of it in a normal scan.
+def extract_coarseToFine(job, report):
+    skipper = FrameSkipper(job.cap, job.file_path, job.fps)
+    sampled = sample_frames(job, report, skipper, job.prescanStep, job.prescanWidth, job.prescanThreshold)
+    job.cap = skipper.cap
+    if (sampled == None):
+        return False
+    positions, values, timestamps, suspicious = sampled
+    exact = numpy.zeros(job.frameCount, dtype=bool)
+    exact[:job.framesDone] = True
+
+    windows = [] if suspicious > full_share * job.frameCount else find_windows(positions, values, job.frameCount, job.prescanThreshold, job.prescanPadding)
+    frames_suspicious = max(suspicious, sum(stop - start for start, stop in windows))
+    if (frames_suspicious > full_share * job.frameCount):
+        print("Fast scan: " + str(frames_suspicious) + " of " + str(job.frameCount) + " frames are suspicious, reading all of them")
+        job.cap.release()
+        job.cap = cv2.VideoCapture(job.file_path)
+        return None
+    print("Fast scan: " + str(len(positions)) + " frames sampled (" + str(skipper.seeks) + " seeks), reading " + str(len(windows)) + " windows of " + str(frames_suspicious) + " frames in full")
+    is_extracted = extract_windows(job, report, skipper, windows, job.prescanThreshold, job.prescanPadding, exact)
+    job.cap = skipper.cap
+    if (not is_extracted):
+        return False
+
+    # All other frames are interpolated between the samples
+    if (len(positions) > 0):
+        estimated = numpy.flatnonzero(~exact)
+        for row in range(0, 5):
+            job.brightness[row, estimated] = numpy.interp(estimated, positions, values[row])
+        if (job.tiles is not None):
+            for row in range(0, len(job.tiles)):
+                job.tiles[row, estimated] = numpy.rint(numpy.interp(estimated, positions, values[5 + row]))
+        job.timestamps[estimated] = numpy.interp(estimated, positions, timestamps)
+        tail = estimated[estimated > positions[-1]]  # Frames after the last sample
+        job.timestamps[tail] = timestamps[-1] + (tail - positions[-1]) / (job.fps if job.fps > 0 else 1)
+    job.exactFrames = exact
+    print("Fast scan: " + str(int(numpy.count_nonzero(exact))) + " of " + str(job.frameCount) + " frames are exact")
+    return True
@@ -0,0 +1,119 @@
+"""
+Instrumentation of scan jobs: wall and CPU time per stage, frames per second and peak memory. The results can be saved
+as JSON or as a trace file, which shows every stage on a timeline in chrome://tracing or ui.perfetto.dev
+"""
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+rate_window = 5.0  # Seconds of progress the moving average of frames per second is based on
+counter_interval = 0.5  # Seconds between two frames per second values in the trace
+
+
+# Highest resident memory of this process so far in bytes, or None where it cannot be determined
+def get_peakMemory():
+    if (resource == None):
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # macOS reports bytes, Linux KiB
+
+
+# Minor page faults of this process so far, each one is a page of memory touched for the first time. Allocating a new
+# buffer for every video frame shows up here. None where it cannot be determined.
+def get_pageFaults():
+    if (resource == None):
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+
+
+# Sums up the wall and CPU time spent in each stage of a job. Stages may contain other stages, e.g. saving the cache
+# is part of reading the video. CPU time counts all threads of the process, so it exceeds the wall time of a stage
+# that keeps several threads busy. Only a few values are recorded per stage, so this is cheap enough to be always on.
+class StageProfiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timestamp_start = time.perf_counter()
+            self.stages = {}  # Totals per stage name, in order of their first use
+            self.events = []  # Trace events
+            self.samples = collections.deque()  # Timestamp and frames read of the last rate_window seconds
+            self.timestamp_counter = 0.0
+            self.framesPerSecond = 0.0
+            self.peakMemory = get_peakMemory()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        timestamp = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - timestamp, time.process_time() - cpu, timestamp)
+
+    # Adds time spent in a stage that has been measured elsewhere, e.g. by the threads of a FramePipeline
+    # Only stages with a 'start' timestamp (time.perf_counter()) show up in the trace.
+    def add_stage(self, name, wall, cpu=None, start=None):
+        with self.lock:
+            stage = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0, "count": 0})
+            stage["wall"] += wall
+            if (cpu != None):
+                stage["cpu"] += cpu
+            stage["count"] += 1
+            if (start != None):
+                self.events.append({"name": name, "ph": "X", "ts": (start - self.timestamp_start) * 1e6, "dur": wall * 1e6, "pid": os.getpid(), "tid": threading.get_ident()})
+            self.peakMemory = get_peakMemory()
+
+    # Starts a new moving average of frames per second, e.g. when a scan begins
+    def reset_rate(self):
+        with self.lock:
+            self.samples.clear()
+            self.framesPerSecond = 0.0
+
+    # Updates the moving average of frames per second with the number of frames read so far
+    def count_frames(self, frames):
+        timestamp = time.perf_counter()
+        with self.lock:
+            self.samples.append((timestamp, frames))
+            while (len(self.samples) > 2 and timestamp - self.samples[0][0] > rate_window):
+                self.samples.popleft()
+            timestamp_first, frames_first = self.samples[0]
+            if (timestamp > timestamp_first and frames >= frames_first):
+                self.framesPerSecond = (frames - frames_first) / (timestamp - timestamp_first)
+            if (timestamp - self.timestamp_counter >= counter_interval):
+                self.timestamp_counter = timestamp
+                self.events.append({"name": "frames/s", "ph": "C", "ts": (timestamp - self.timestamp_start) * 1e6, "pid": os.getpid(), "args": {"frames/s": round(self.framesPerSecond, 1)}})
+
+    def get_stats(self):
+        with self.lock:
+            return {"seconds": time.perf_counter() - self.timestamp_start, "stages": {name: dict(stage) for name, stage in self.stages.items()},
+                    "framesPerSecond": self.framesPerSecond, "peakMemory": self.peakMemory}
+
+    # Short summary for status lines, e.g. "open 0.1 s, extract 4.2 s, analyze 0.0 s, peak memory 210 MB"
+    def format_stages(self):
+        stats = self.get_stats()
+        text = ", ".join(name + " " + str(round(stage["wall"], 1)) + " s" for name, stage in stats["stages"].items())
+        if (stats["peakMemory"] != None):
+            text += ", peak memory " + str(stats["peakMemory"] >> 20) + " MB"
+        return text
+
+    def save_json(self, file_path):
+        with open(file_path, "w") as file:
+            json.dump(self.get_stats(), file, indent=2)
+
+    def save_trace(self, file_path):
+        with self.lock:
+            trace = {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+        with open(file_path, "w") as file:
+            json.dump(trace, file)
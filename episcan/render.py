@@ -0,0 +1,165 @@
+"""
+Graphs of a job's results. matplotlib is only imported once a graph is actually requested
+Lines are drawn from decimated values, about two points per pixel column, so drawing takes about the same time for any
+video length. Zooming in decimates the visible part again from the full-resolution values.
+"""
+import math
+import numpy
+import time
+
+from .job import get_frameTimes
+
+colormaps = {}  # Both gradients for each combination of colors, created once
+
+
+def generate_color(job, value):
+    import matplotlib.colors as mcolors
+    key = (job.color1, job.color2, job.color3)
+    if (key not in colormaps):
+        colormaps[key] = (mcolors.LinearSegmentedColormap.from_list('custom_cmap', [job.color1, job.color2]),  # Orange --> Red
+                          mcolors.LinearSegmentedColormap.from_list('custom_cmap', [job.color2, job.color3]))  # Red --> Black
+    if value <= job.colorBorderValue:
+        scaled_value = value / job.colorBorderValue
+        cmap = colormaps[key][0]
+    else:
+        scaled_value = (value - job.colorBorderValue) / (1 - job.colorBorderValue)
+        cmap = colormaps[key][1]
+
+    color = cmap(scaled_value)
+    hex_code = mcolors.rgb2hex(color)
+    return hex_code
+
+
+# Reduces values[start:stop] to the lowest and highest value within each of 'bins' columns, so a line through them
+# covers the same pixels as a line through all values. Returns the frame numbers and values of the points to draw.
+def decimate_minMax(values, start, stop, bins):
+    start = max(0, start)
+    stop = min(len(values), stop)
+    if (stop - start <= 2 * bins):
+        return numpy.arange(start, stop), numpy.asarray(values[start:stop])
+    offsets = (numpy.arange(0, bins) * (stop - start)) // bins  # First frame of each column, relative to start
+    visible = numpy.asarray(values[start:stop])
+    points = numpy.empty(2 * bins, dtype=visible.dtype)
+    points[0::2] = numpy.minimum.reduceat(visible, offsets)
+    points[1::2] = numpy.maximum.reduceat(visible, offsets)
+    return numpy.repeat(start + offsets, 2), points
+
+
+# A line showing one row of values per frame at the given 'times' (in seconds, see get_frameTimes). It is decimated to
+# the width of the axes in pixels and decimated again from the full-resolution values whenever the visible range of the
+# x-axis changes.
+class DecimatedLine:
+    def __init__(self, ax, values, times, **style):
+        self.ax = ax
+        self.values = values
+        self.times = times
+        self.line, = ax.plot([], [], **style)
+        self.update()
+
+    def update(self):
+        left, right = self.ax.get_xlim()
+        start = int(numpy.searchsorted(self.times, left, side="right")) - 2
+        stop = int(numpy.searchsorted(self.times, right)) + 2
+        frames, points = decimate_minMax(self.values, start, stop, max(1, int(self.ax.bbox.width)))
+        self.line.set_data(self.times[frames], points)
+
+
+
+# Draws the statistics of the job's analysis mode. The graph is saved as 'png_path' if given, otherwise it is shown
+# in a window. Saving works without pyplot, so no GUI backend gets loaded in headless mode.
+def render_graph(job, png_path=None):
+    timestamp = time.perf_counter()
+    cpu = time.process_time()
+    # Create a plot to display the results and make it quite wide and gray in background
+    if (png_path != None):
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(15, 5))
+        ax = fig.add_subplot()
+    else:
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots(figsize=(15, 5))
+
+    # Set the background color based on y-values
+    ax.axhspan(0, 20, facecolor='#00ff00', alpha=0.4, edgecolor='none')     # lime
+    ax.axhspan(20, 25, facecolor='#7dff00', alpha=0.4, edgecolor='none')
+    ax.axhspan(25, 30, facecolor='#b1ff00', alpha=0.4, edgecolor='none')
+    ax.axhspan(30, 35, facecolor='#dbff00', alpha=0.4, edgecolor='none')
+    ax.axhspan(35, 60, facecolor='#ffff00', alpha=0.4, edgecolor='none')    # yellow
+    ax.axhspan(60, 65, facecolor='#ffdc00', alpha=0.4, edgecolor='none')
+    ax.axhspan(65, 70, facecolor='#ffb900', alpha=0.4, edgecolor='none')
+    ax.axhspan(70, 75, facecolor='#ff9600', alpha=0.4, edgecolor='none')
+    ax.axhspan(75, 80, facecolor='#ff7200', alpha=0.4, edgecolor='none')    # orange
+    ax.axhspan(80, 85, facecolor='#ff6200', alpha=0.4, edgecolor='none')
+    ax.axhspan(85, 90, facecolor='#ff4e00', alpha=0.4, edgecolor='none')
+    ax.axhspan(90, 95, facecolor='#ff3600', alpha=0.4, edgecolor='none')
+    ax.axhspan(95, 100, facecolor='#ff0000', alpha=0.4, edgecolor='none')   # red
+    ax.axhspan(100, job.yLim, facecolor='#950101', alpha=0.4, edgecolor='none')
+    print("plotting begins shortly. type=" + str(job.type))
+    # The x-axis shows the time in seconds, its range is set before any lines are added as they are decimated to it
+    times = get_frameTimes(job)
+    ax.set_xlim(0, times[-1])
+    lines = []
+
+    if (job.exactFrames is not None):
+        # After a fast scan, shade the parts of the video that were only sampled, as their values are estimates
+        edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([1], job.exactFrames, [1])).astype(numpy.int8)))
+        for start, stop in zip(edges[::2], edges[1::2]):
+            ax.axvspan(times[start], times[stop], facecolor='#808080', alpha=0.5, edgecolor='none', label='estimated' if start == edges[0] else None)
+
+    if (job.type == 1 or job.type == 4):
+        # Create a plot to display the results for absolute brightness values, or those of the worst tile
+        print("Plotting absolute brightness plots as requested")
+        table = job.brightnessAbsolute if job.type == 1 else job.brightnessTiles
+        # The number of plots will either be equal to gui_maxSpan, but limited to gui_plotColors
+        print(str(job.frameSpan) + " plots calculated, a maximum of " + str(job.plotMaxColors) + " can be drawn")
+        if (job.frameSpan<=job.plotMaxColors):
+            print("Plotting " + str(job.frameSpan) + " plots as requested")
+            for i in range(0, job.frameSpan):
+                hex_code = generate_color(job, i / job.frameSpan)
+                opacity = i / job.plotMaxColors
+                # print(hex_code)
+                lines.append(DecimatedLine(ax, table[i], times, label='span='+str(i), color=hex_code, alpha=opacity))
+        else:
+            print(str(job.frameSpan) + " plots calculated but only " + str(job.plotMaxColors) + " will be drawn")
+            for i in range(0, job.plotMaxColors):
+                hex_code = generate_color(job, i / job.plotMaxColors)
+                opacity = i / job.plotMaxColors
+                # print(hex_code)
+                lines.append(DecimatedLine(ax, table[math.floor((i / job.plotMaxColors) * (job.frameSpan - 1))], times, label='span=' + str(math.floor((i / job.plotMaxColors) * (job.frameSpan - 1))), color=hex_code, alpha=opacity))
+    elif (job.type == 2):
+        # TODO: Implement perceived brightness plotting
+        print("...")
+    elif (job.type == 3):
+        # Create a plot to display the results for R, G and B separately
+        print("Plotting R, G and B plots as requested")
+        # The number of plots will either be equal to gui_maxSpan, but limited to gui_plotColors
+        lines.append(DecimatedLine(ax, job.brightnessChannelR[0], times, label='RED', color='#ff0000'))
+        lines.append(DecimatedLine(ax, job.brightnessChannelG[0], times, label='GREEN', color='#00ff00'))
+        lines.append(DecimatedLine(ax, job.brightnessChannelB[0], times, label='BLUE', color='#0000ff'))
+    else:
+        print("ERROR: Unknown analysis mode selected for plotting: " + str(job.type))
+        return
+
+
+
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Change in brightness')
+    ax.set_ylim(0, job.yLim)
+    # ax.legend()
+
+    # Zooming, panning and resizing the window decimate the lines again
+    def update_lines(*args):
+        for line in lines:
+            line.update()
+    ax.callbacks.connect('xlim_changed', update_lines)
+    fig.canvas.mpl_connect('resize_event', update_lines)
+
+    if (png_path != None):
+        print("Silent mode, not displaying graphs")
+        fig.savefig(png_path)
+        print("Saved as " + png_path)
+    # Time spent looking at the window is not part of rendering
+    job.profiler.add_stage("render", time.perf_counter() - timestamp, time.process_time() - cpu, timestamp)
+    if (png_path == None):
+        print("Plotting in 3... 2... 1...")
+        plt.show()
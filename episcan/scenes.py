@@ -0,0 +1,160 @@
+"""
+Flagged scenes: the parts of a video whose statistics across frame spans exceed a threshold, and previews of them
+for manual review. Previews seek straight to each scene, so only the flagged parts of the video are decoded again.
+"""
+import datetime
+import os
+
+import cv2
+import numpy
+
+from .job import get_frameTimes, get_spanTables, types
+from .stream import summary_thresholds
+
+channel_names = ["red", "green", "blue"]  # Metrics of analysis mode 3, one per span table
+
+
+# Returns the first and the last frame + 1 of every run of frames whose peak exceeds 'threshold'. Runs separated by
+# 'min_gap' frames or less are merged into one.
+def find_intervals(peaks, threshold, min_gap=0):
+    above = numpy.concatenate(([False], peaks > threshold, [False]))
+    edges = numpy.flatnonzero(above[1:] != above[:-1])
+    starts, stops = edges[0::2], edges[1::2]
+    if (min_gap > 0 and len(starts) > 1):
+        is_new = numpy.concatenate(([True], starts[1:] - stops[:-1] > min_gap))  # Does run k begin a new interval?
+        stops = stops[numpy.concatenate((is_new[1:], [True]))]
+        starts = starts[is_new]
+    return starts, stops
+
+
+# Index of the scenes of the job's current analysis mode that exceed 'threshold' (the yellow area by default).
+# Scenes less than 'gap_seconds' apart are merged. Each scene holds its first and last frame + 1, its peak, the metric
+# (span table) and the frame span the peak was found in. Scenes touching frames estimated by a fast scan are marked.
+def find_scenes(job, threshold=summary_thresholds[0], gap_seconds=1.0):
+    tables = get_spanTables(job)
+    if (not tables or job.frameCount == 0):
+        return []
+    fps = job.fps if job.fps > 0 else 1
+    times = get_frameTimes(job)
+    table_peaks = numpy.array([table.peaks() for table in tables])
+    peaks = table_peaks.max(axis=0)
+    names = channel_names if job.type == 3 else [types[job.type - 1]]
+    starts, stops = find_intervals(peaks, threshold, int(gap_seconds * fps))
+    scenes = []
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        peak_frame = start + int(numpy.argmax(peaks[start:stop]))
+        metric = int(numpy.argmax(table_peaks[:, peak_frame]))
+        scene = {"start": start, "stop": stop, "startSeconds": float(times[start]), "stopSeconds": float(times[stop]),
+                 "peak": float(peaks[peak_frame]), "peakFrame": peak_frame, "peakSeconds": float(times[peak_frame]),
+                 "metric": names[metric], "span": int(numpy.argmax(tables[metric].calc_column(peak_frame))) + 2}
+        if (job.exactFrames is not None):
+            scene["isEstimated"] = not bool(job.exactFrames[start:stop].all())
+        scenes.append(scene)
+    return scenes
+
+
+def format_time(seconds):
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+# Writes a preview of every scene to 'output_dir' ('<video file>.previews' by default) and returns their paths.
+# kind "sheet" saves a contact sheet of 'thumbnail_count' frames per scene as PNG, kind "clip" saves the scene as a
+# short MJPG video. Previews start and end 'padding_seconds' around the scene, so the flashing can be seen in context.
+# Each scene gets the path of its preview as 'preview', None if no frames of it could be read.
+def export_previews(job, scenes, output_dir=None, kind="sheet", padding_seconds=1.0, thumbnail_count=8, thumbnail_width=320, columns=4, report=None):
+    if (kind not in ("sheet", "clip")):
+        raise ValueError("Unknown kind of preview: " + str(kind))
+    if (output_dir == None):
+        output_dir = job.file_path + ".previews"
+    os.makedirs(output_dir, exist_ok=True)
+    fps = job.fps if job.fps > 0 else 1
+    padding = int(padding_seconds * fps)
+    times = get_frameTimes(job)
+    # The job's capture is reused if it is still open, its position does not matter once all frames have been read
+    is_capOwned = job.cap == None or not job.cap.isOpened()
+    cap = cv2.VideoCapture(job.file_path) if is_capOwned else job.cap
+    paths = []
+    failed = []  # Numbers of the scenes without a preview
+    try:
+        for n, scene in enumerate(scenes):
+            start = max(0, scene["start"] - padding)
+            stop = min(job.frameCount, scene["stop"] + padding)
+            position = seek_capture(cap, start)
+            name = "scene" + str(n + 1).zfill(3) + "_" + format_time(scene["startSeconds"]).replace(":", "-")
+            if (kind == "clip"):
+                path = os.path.join(output_dir, name + ".avi")
+                is_written = write_clip(cap, path, position, stop, fps, times)
+            else:
+                path = os.path.join(output_dir, name + ".png")
+                is_written = write_sheet(cap, path, position, stop, times, scene, thumbnail_count, thumbnail_width, columns)
+            scene["preview"] = path if is_written else None
+            if (is_written):
+                paths.append(path)
+            else:
+                failed.append(n + 1)
+            if (report != None):
+                report("Exporting previews", n + 1, len(scenes))
+    finally:
+        if (is_capOwned):
+            cap.release()
+    if (failed):
+        print("WARNING: No frames could be read for scenes " + ", ".join(str(n) for n in failed) + ", no previews saved for them")
+    return paths
+
+
+# Seeks 'cap' to frame 'start' and returns the frame it actually got to. Codecs that can only seek to keyframes may
+# land before it, the frames up to 'start' are skipped then.
+def seek_capture(cap, start):
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    while (position < start and cap.grab()):
+        position += 1
+    if (position != start):
+        print("WARNING: Seeking to frame " + str(start) + " is inaccurate (reported " + str(position) + "), preview may be off")
+    return position
+
+
+# Returns whether any frames were written
+def write_clip(cap, path, position, stop, fps, times):
+    writer = None
+    try:
+        for i in range(position, stop):
+            is_validFrame, frame = cap.read()
+            if not is_validFrame:
+                break
+            if (writer == None):
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (frame.shape[1], frame.shape[0]))
+            cv2.putText(frame, format_time(times[i]), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+            writer.write(frame)
+    finally:
+        if (writer != None):
+            writer.release()
+    return writer != None
+
+
+# Frames between the thumbnails are only grabbed, not converted. Thumbnails of frames inside the scene get a red border.
+# Returns whether the sheet was saved.
+def write_sheet(cap, path, position, stop, times, scene, thumbnail_count, thumbnail_width, columns):
+    selected = set(numpy.linspace(position, max(position, stop - 1), thumbnail_count).round().astype(int).tolist())
+    thumbnails = []
+    for i in range(position, stop):
+        if (i not in selected):
+            if not cap.grab():
+                break
+            continue
+        is_validFrame, frame = cap.read()
+        if not is_validFrame:
+            break
+        height = max(1, round(frame.shape[0] * thumbnail_width / frame.shape[1]))
+        thumbnail = cv2.resize(frame, (thumbnail_width, height), interpolation=cv2.INTER_AREA)
+        if (scene["start"] <= i < scene["stop"]):
+            cv2.rectangle(thumbnail, (0, 0), (thumbnail_width - 1, height - 1), (0, 0, 255), 4)
+        cv2.putText(thumbnail, format_time(times[i]) + " (" + str(i) + ")", (6, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        thumbnails.append(thumbnail)
+    if (not thumbnails):
+        return False
+    # Fill up the last row, so all rows are of the same width
+    columns = min(columns, len(thumbnails))
+    thumbnails += [numpy.zeros_like(thumbnails[0])] * (-len(thumbnails) % columns)
+    rows = [numpy.hstack(thumbnails[k:k + columns]) for k in range(0, len(thumbnails), columns)]
+    return cv2.imwrite(path, numpy.vstack(rows))
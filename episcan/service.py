@@ -0,0 +1,279 @@
+"""
+Service mode: watches directories for new video files and scans them as they arrive
+
+    python -m episcan.service [options] <directory> [...]
+
+Files are only queued once they have stopped changing for a while, so downloads still being written are not scanned
+early. The queue and all results are saved to a state file, so a restarted service continues where it stopped.
+Stopping the service cancels running scans, which save their progress and resume from there on the next start.
+A local HTTP endpoint reports the state as JSON:
+    GET /status   everything below plus the watched directories
+    GET /queue    files waiting to be scanned, highest priority first
+    GET /running  files being scanned right now, with their progress
+    GET /results  finished scans, latest first
+"""
+import argparse
+import heapq
+import http.server
+import json
+import os
+import threading
+import time
+
+from .batch import add_scanArguments, collect_files, find_upToDate, get_settings, scan_batchFile, write_json
+from .catalog import Catalog
+from .job import Job, ProgressReporter
+
+service_port = 8765  # Port of the status endpoint, only reachable from this machine
+stop_timeout = 60.0  # Seconds stop() waits for cancelled scans to save their progress
+results_kept = 1000  # Number of finished scans kept in the state, older ones are dropped
+
+
+# Scans new video files of 'directories' on 'worker_count' threads. Files of the first directory have the highest
+# priority (0), those of the second one come next (1) and so on. Within a priority, files are scanned in the order
+# they arrived. A file is queued once its size and modification time have not changed for 'settle_seconds'.
+# Each scan runs the same steps as a batch scan (scan_batchFile), with the same settings.
+class WatchService:
+    def __init__(self, directories, settings, state_path, worker_count=1, interval=2.0, settle_seconds=5.0, port=service_port, is_graphRequested=True, is_traceRequested=False, previews=None):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.settings = settings
+        self.state_path = state_path
+        self.worker_count = max(1, worker_count)
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self.port = port
+        self.scan_options = (is_graphRequested, is_traceRequested, previews)
+        self.lock = threading.Condition()
+        self.queue = []  # Heap of (priority, sequence number, file, size, modification time)
+        self.queued = set()  # Files in the queue
+        self.sequence = 0
+        self.pending = {}  # Files that changed recently: (size, modification time, time they were last seen changing)
+        self.running = {}  # Progress of the files being scanned right now
+        self.jobs = {}  # Jobs scanning these files, so they can be cancelled
+        self.results = []  # Finished scans, oldest first
+        self.finished = {}  # Size and modification time of each file at the time it was scanned
+        self.is_stopped = False
+        self.server = None
+        self.threads = []
+        self.load_state()
+
+    # Restores the queue and the results. Files that were being scanned when the service stopped are queued again.
+    def load_state(self):
+        if (not os.path.isfile(self.state_path)):
+            return
+        with open(self.state_path) as file:
+            state = json.load(file)
+        for entry in state.get("running", []) + state.get("queue", []):
+            self.enqueue(entry["file"], entry["priority"], entry["size"], entry["mtime_ns"])
+        for result in state.get("results", [])[::-1]:
+            self.add_result(result)
+        print("Restored " + str(len(self.queue)) + " queued files and " + str(len(self.results)) + " results from " + self.state_path)
+
+    # Saves the state atomically, so an interrupted write never leaves a broken state file behind. Call with the lock held.
+    def save_state(self):
+        write_json(self.state_path, self.get_state())
+
+    # Call with the lock held
+    def get_state(self):
+        return {"directories": self.directories, "settings": self.settings,
+                "queue": [{"file": file, "priority": priority, "size": size, "mtime_ns": mtime_ns} for priority, sequence, file, size, mtime_ns in sorted(self.queue)],
+                "running": list(self.running.values()), "results": self.results[::-1]}
+
+    def enqueue(self, file_path, priority, size, mtime_ns):
+        heapq.heappush(self.queue, (priority, self.sequence, file_path, size, mtime_ns))
+        self.queued.add(file_path)
+        self.sequence += 1
+
+    def add_result(self, result):
+        self.results.append(result)
+        del self.results[:-results_kept]
+        self.finished[result["file"]] = (result["size"], result.get("mtime_ns"))
+
+    # Is the file queued, being scanned or scanned already in its current state? Call with the lock held.
+    def is_known(self, file_path, size, mtime_ns):
+        return file_path in self.queued or file_path in self.running or self.finished.get(file_path) == (size, mtime_ns)
+
+    # Looks for new or changed video files and queues those that have stopped changing. Files are only looked at (and
+    # hashed, with a catalog) without the lock held, so workers and the status endpoint are not held up meanwhile.
+    def poll(self):
+        timestamp = time.monotonic()
+        found = {}
+        for priority, directory in enumerate(self.directories):
+            for file_path in collect_files([directory]):
+                # Previews of flagged scenes may be video clips themselves
+                if (file_path not in found and not any(part.endswith(".previews") for part in file_path.split(os.sep))):
+                    found[file_path] = priority
+        stats = {}
+        for file_path in found:
+            try:
+                stats[file_path] = os.stat(file_path)
+            except OSError:
+                pass  # Deleted in the meantime
+
+        # 1. Files that have not changed for settle_seconds
+        settled = []
+        with self.lock:
+            for file_path, stat in stats.items():
+                if (self.is_known(file_path, stat.st_size, stat.st_mtime_ns)):
+                    continue
+                size, mtime_ns, since = self.pending.get(file_path, (None, None, timestamp))
+                if (size != stat.st_size or mtime_ns != stat.st_mtime_ns):
+                    self.pending[file_path] = (stat.st_size, stat.st_mtime_ns, timestamp)  # Still being written
+                    continue
+                if (timestamp - since < self.settle_seconds):
+                    continue
+                del self.pending[file_path]
+                settled.append((file_path, found[file_path], stat.st_size, stat.st_mtime_ns))
+            # Files that disappeared before settling are forgotten
+            for file_path in [file_path for file_path in self.pending if file_path not in stats]:
+                del self.pending[file_path]
+        if (not settled):
+            return
+
+        # 2. Which of them have valid results already
+        reasons = []
+        catalog = Catalog(self.settings["catalogPath"]) if self.settings.get("catalogPath") != None else None
+        try:
+            for file_path, priority, size, mtime_ns in settled:
+                reasons.append(find_upToDate(file_path, self.settings, catalog))
+        finally:
+            if (catalog != None):
+                catalog.close()
+
+        # 3. All others are queued
+        with self.lock:
+            for (file_path, priority, size, mtime_ns), reason in zip(settled, reasons):
+                if (self.is_known(file_path, size, mtime_ns)):
+                    continue
+                if (reason != None):
+                    self.add_result({"file": file_path, "size": size, "mtime_ns": mtime_ns, "status": "skipped", "reason": reason, "seconds": 0.0})
+                else:
+                    print("Queued " + file_path)
+                    self.enqueue(file_path, priority, size, mtime_ns)
+                    self.lock.notify()
+            self.save_state()
+
+    def run_worker(self):
+        while True:
+            with self.lock:
+                while (not self.queue and not self.is_stopped):
+                    self.lock.wait()
+                if (self.is_stopped):
+                    return
+                priority, sequence, file_path, size, mtime_ns = heapq.heappop(self.queue)
+                self.queued.discard(file_path)
+                progress = {"file": file_path, "priority": priority, "size": size, "mtime_ns": mtime_ns, "started": time.time(), "task": "", "current": 0, "total": 0, "eta": -1.0}
+                self.running[file_path] = progress
+                job = Job()
+                self.jobs[file_path] = job
+                self.save_state()
+
+            report = ProgressReporter(lambda task, current, total, eta: progress.update({"task": task, "current": current, "total": total, "eta": eta}))
+            print("Scanning " + file_path)
+            if (os.path.isfile(file_path)):
+                result = scan_batchFile(file_path, self.settings, *self.scan_options, report=report, job=job)
+            else:
+                result = {"file": file_path, "size": size, "status": "failed", "error": "File not found", "seconds": 0.0}
+            with self.lock:
+                del self.jobs[file_path]
+                if (self.is_stopped and job.is_cancelRequested):
+                    # Cancelled by stop(): the file stays among the running ones in the state, so it is queued again
+                    # on the next start, and the scan resumes from the checkpoint saved in its cache file
+                    print("Cancelled: " + file_path)
+                    return
+                result["mtime_ns"] = mtime_ns
+                result["finished"] = time.time()
+                print(result["status"] + ": " + file_path + " (" + str(round(result["seconds"], 1)) + " s)")
+                del self.running[file_path]
+                self.add_result(result)
+                self.save_state()
+
+    # Starts the status endpoint and the worker threads, then polls the directories until stop() is called
+    def run(self):
+        self.start()
+        try:
+            while (not self.is_stopped):
+                self.poll()
+                with self.lock:
+                    self.lock.wait_for(lambda: self.is_stopped, timeout=self.interval)
+        finally:
+            self.stop()
+
+    def start(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", self.port), StatusHandler)
+        self.server.service = self
+        self.port = self.server.server_address[1]  # Port 0 picks a free one
+        self.threads = [threading.Thread(target=self.server.serve_forever, daemon=True)]
+        self.threads += [threading.Thread(target=self.run_worker, daemon=True) for i in range(0, self.worker_count)]
+        for thread in self.threads:
+            thread.start()
+        print("Watching " + ", ".join(self.directories) + ", status at http://127.0.0.1:" + str(self.port) + "/status")
+
+    # Running scans are cancelled and save their progress, they continue from there on the next start just like the
+    # files still queued. Waits up to 'timeout' seconds for them.
+    def stop(self, timeout=stop_timeout):
+        with self.lock:
+            if (self.is_stopped):
+                return
+            self.is_stopped = True
+            for job in self.jobs.values():
+                job.set_cancelRequested(True)
+            self.lock.notify_all()
+        if (self.server != None):
+            self.server.shutdown()
+            self.server.server_close()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads[1:]:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        with self.lock:
+            if (self.jobs):
+                print("WARNING: " + str(len(self.jobs)) + " scans did not stop in time, they are scanned again on the next start")
+            self.save_state()
+
+
+class StatusHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        service = self.server.service
+        with service.lock:
+            state = service.get_state()
+        path = self.path.split("?")[0].rstrip("/")
+        if (path in ("", "/status")):
+            body = state
+        elif (path[1:] in ("queue", "running", "results")):
+            body = state[path[1:]]
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Status requests are not worth a line each
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="episcan.service", description="Watch directories and scan new video files as they arrive")
+    parser.add_argument("directories", nargs="+", help="directories to watch (recursively), the first one has the highest priority")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="number of files scanned at the same time (default: %(default)s)")
+    parser.add_argument("--state", default="episcan_service.json", help="where to keep the queue and results across restarts (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=service_port, help="port of the status endpoint on 127.0.0.1 (default: %(default)s)")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between two looks at the directories (default: %(default)s)")
+    parser.add_argument("--settle", type=float, default=5.0, help="seconds a file must not change before it is scanned (default: %(default)s)")
+    add_scanArguments(parser)
+    args = parser.parse_args(argv)
+
+    service = WatchService(args.directories, get_settings(args), args.state, args.workers, args.interval, args.settle, args.port, not args.no_graph, args.trace, args.previews)
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        print("Stopping, waiting for running scans to save their progress...")
+        service.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,157 @@
+"""
+Statistics across frame spans, calculated from the raw brightness values of each frame
+"""
+import collections
+
+import numpy
+
+
+# Sum up the brightness changes across every frame span 1...frame_span-1 for a single row of raw values
+# Row (frame_span - 1) of the result holds the changes across frame_span + 1 neighboring frames starting at each frame.
+# Works on cumulative sums of the absolute frame-to-frame changes, so every span costs a single subtraction.
+def calc_spanTable(values, frame_span, is_scaled=False):
+    frame_count = len(values)
+    table = numpy.zeros((frame_span, frame_count))
+    if (frame_count < 2 or frame_span < 2):
+        return table
+
+    # changes[j] = |values[j] - values[j + 1]|, prefix[k] = sum of changes[0...k-1]
+    changes = numpy.abs(numpy.diff(numpy.asarray(values, dtype=numpy.float64)))
+    prefix = numpy.zeros(frame_count + frame_span)
+    numpy.cumsum(changes, out=prefix[1:frame_count])
+    prefix[frame_count:] = numpy.nan  # Windows reaching past the last frame stay empty (0)
+
+    # windows[i, span] = prefix[i + span], so the sum for (span, i) is prefix[i + span] - prefix[i]
+    windows = numpy.lib.stride_tricks.sliding_window_view(prefix, frame_span)[:frame_count]
+    numpy.subtract(windows[:, 1:].T, prefix[:frame_count], out=table[:-1])
+    numpy.nan_to_num(table, copy=False, nan=0.0)
+    # The last line is never filled, as spans only run up to frame_span - 1
+
+    if (is_scaled):
+        # Absolute brightness is normalized by the span length
+        table[:-1] /= 0.7 * numpy.arange(1, frame_span)[:, None]
+    return table
+
+
+# The same statistics as calc_spanTable, but each line is only calculated once it is requested and then kept as
+# float32, up to 'cache_rows' lines at once (least recently used ones are dropped). Only the cumulative sums of the
+# frame-to-frame changes are kept for all frames, so memory scales with the lines viewed instead of frame_span.
+# Lines do not depend on frame_span (except for the last one staying empty), so changing it keeps all cached lines.
+# Indexing with table[i] returns line i, len(table) is frame_span, like for the table returned by calc_spanTable.
+class SpanTable:
+    def __init__(self, values, frame_span, is_scaled=False, cache_rows=32):
+        self.frame_count = len(values)
+        self.is_scaled = is_scaled  # Absolute brightness is normalized by the span length
+        self.cache_rows = cache_rows
+        self.rows = collections.OrderedDict()  # Cached lines by index, least recently used first
+        # prefix[k] = sum of changes[0...k-1], changes[j] = |values[j] - values[j + 1]|
+        self.prefix = numpy.zeros(max(1, self.frame_count))
+        if (self.frame_count >= 2):
+            numpy.cumsum(numpy.abs(numpy.diff(numpy.asarray(values, dtype=numpy.float64))), out=self.prefix[1:])
+        self.set_frameSpan(frame_span)
+
+    def set_frameSpan(self, frame_span):
+        self.frame_span = frame_span
+        self.peak_values = None  # Result of peaks(), kept until the frame span changes
+        # The last line is never filled, so it is not cached. Lines beyond it are dropped.
+        for i in [i for i in self.rows if i >= frame_span - 1]:
+            del self.rows[i]
+
+    def __len__(self):
+        return self.frame_span
+
+    def __getitem__(self, i):
+        if (i < 0):
+            i += self.frame_span
+        if (i < 0 or i >= self.frame_span):
+            raise IndexError("Span table line " + str(i) + " out of range, frame span is " + str(self.frame_span))
+        if (i in self.rows):
+            self.rows.move_to_end(i)
+            return self.rows[i]
+        row = self.calc_row(i)
+        if (i < self.frame_span - 1 and self.cache_rows > 0):
+            self.rows[i] = row
+            if (len(self.rows) > self.cache_rows):
+                self.rows.popitem(last=False)
+        return row
+
+    def __array__(self, dtype=None, copy=None):
+        return numpy.array([self[i] for i in range(0, self.frame_span)], dtype=dtype).reshape(self.frame_span, self.frame_count)
+
+    # Line i holds the changes across i + 2 neighboring frames starting at each frame, the sum for (i, j) being
+    # prefix[j + i + 1] - prefix[j]. Windows reaching past the last frame stay empty (0).
+    def calc_row(self, i):
+        row = numpy.zeros(self.frame_count, dtype=numpy.float32)
+        count = self.frame_count - i - 1
+        if (i < self.frame_span - 1 and count > 0):
+            sums = self.prefix[i + 1:i + 1 + count] - self.prefix[:count]
+            if (self.is_scaled):
+                sums /= 0.7 * (i + 1)
+            row[:count] = sums
+        return row
+
+    # Values of all lines at frame j, without calculating the lines
+    def calc_column(self, j):
+        column = numpy.zeros(self.frame_span, dtype=numpy.float32)
+        count = min(self.frame_span - 1, self.frame_count - j - 1)
+        if (count > 0):
+            sums = self.prefix[j + 1:j + 1 + count] - self.prefix[j]
+            if (self.is_scaled):
+                sums /= 0.7 * numpy.arange(1, count + 1)
+            column[:count] = sums
+        return column
+
+    # Highest value across all lines at each frame. Lines not cached yet are calculated but not kept, the result is kept
+    # until the frame span changes, so it must not be modified.
+    def peaks(self):
+        if (self.peak_values is None):
+            self.peak_values = numpy.zeros(self.frame_count, dtype=numpy.float32)
+            for i in range(0, self.frame_span - 1):
+                numpy.maximum(self.peak_values, self.rows[i] if i in self.rows else self.calc_row(i), out=self.peak_values)
+        return self.peak_values
+
+
+# Statistics across frame spans of the worst tile: line i holds the highest change across i + 2 neighboring frames
+# found in any single tile, starting at each frame. 'tiles' holds the means of each tile per frame (one line per tile,
+# e.g. the luminance and red channel tiles of a grid). Changes are normalized by the span length, like the absolute
+# brightness. Lines are calculated in blocks of frames from the tiles, so only one block's sums are in memory at once.
+class TileSpanTable(SpanTable):
+    def __init__(self, tiles, frame_span, cache_rows=32, block_size=4096):
+        self.tiles = tiles
+        self.frame_count = tiles.shape[1]
+        self.is_scaled = True
+        self.cache_rows = cache_rows
+        self.block_size = block_size
+        self.rows = collections.OrderedDict()
+        self.set_frameSpan(frame_span)
+
+    # Changes across i + 2 neighboring frames of every tile, for the windows starting at frames start...stop-1
+    def calc_tileSums(self, i, start, stop):
+        block = self.tiles[:, start:stop + i + 1].astype(numpy.float32)
+        prefix = numpy.zeros(block.shape)
+        numpy.cumsum(numpy.abs(numpy.diff(block, axis=1)), axis=1, out=prefix[:, 1:])
+        return prefix[:, i + 1:i + 1 + stop - start] - prefix[:, :stop - start]
+
+    def calc_row(self, i):
+        row = numpy.zeros(self.frame_count, dtype=numpy.float32)
+        count = self.frame_count - i - 1
+        if (i < self.frame_span - 1 and count > 0):
+            for start in range(0, count, self.block_size):
+                stop = min(count, start + self.block_size)
+                row[start:stop] = self.calc_tileSums(i, start, stop).max(axis=0)
+            row /= 0.7 * (i + 1)
+        return row
+
+    # Values of all lines at frame j, each being the highest change of any tile across that span (see find_worstTile for
+    # the tile itself)
+    def calc_column(self, j):
+        column = numpy.zeros(self.frame_span, dtype=numpy.float32)
+        for i in range(0, min(self.frame_span - 1, self.frame_count - j - 1)):
+            column[i] = self.calc_tileSums(i, j, j + 1)[:, 0].max() / (0.7 * (i + 1))
+        return column
+
+    def find_worstTile(self, j):
+        peaks = numpy.zeros(len(self.tiles))
+        for i in range(0, min(self.frame_span - 1, self.frame_count - j - 1)):
+            numpy.maximum(peaks, self.calc_tileSums(i, j, j + 1)[:, 0] / (0.7 * (i + 1)), out=peaks)
+        return int(numpy.argmax(peaks))
@@ -0,0 +1,173 @@
+"""
+Streaming analysis: the statistics across frame spans are updated frame by frame as the brightness values arrive,
+keeping only the last frame span's worth of state. Threshold crossings are reported while the video is still read.
+"""
+import cv2
+import numpy
+
+from .extract import FrameReducer
+
+summary_thresholds = (35, 75, 95)  # Borders of the yellow, orange and red areas in the graph
+type_rows = {1: [0], 2: [1], 3: [2, 3, 4]}  # Rows of table 'brightness' each analysis mode is based on, 0 = all of them
+rebase_limit = 1e6  # Cumulative sums are shifted back towards 0 once they grow past this, to keep them precise
+
+
+# Calculates the same peaks as SpanTable.peaks() for one analysis mode, without keeping the values of all frames.
+# The cumulative sums of the frame-to-frame changes of the last 'frame_span' frames are kept in a ring, so the
+# changes across every span starting at a frame are known as soon as frame_span - 1 more frames have arrived.
+# Every time a frame's peak crosses one of 'thresholds', an event is passed to 'on_event' and kept in 'events'.
+# Times are those passed to push() along with each frame, as reported by the video file, so they are right for variable
+# frame rates. Frames without a time, or with one not after the previous frame's, are placed 1 / fps after it.
+# Once a peak exceeds 'stop_threshold' (the red area by default), the verdict is "unsafe".
+# Type 0 follows all metrics at once, the peak of a frame being the highest of any of them: absolute and perceived
+# brightness, the R, G, B channels and, with a 'tile_count', the means of each tile, which follow the 5 values in push().
+class StreamDetector:
+    def __init__(self, frame_span, fps, type=1, thresholds=summary_thresholds, stop_threshold=None, on_event=None, tile_count=0):
+        self.frame_span = max(1, frame_span)
+        self.fps = fps if fps > 0 else 1
+        self.rows = type_rows[type] if type > 0 else list(range(0, 5 + tile_count))
+        self.thresholds = thresholds
+        self.stop_threshold = stop_threshold if stop_threshold != None else thresholds[-1]
+        self.on_event = on_event
+        self.ring = numpy.zeros((len(self.rows), self.frame_span))  # Cumulative sums of the last frame_span frames
+        self.total = numpy.zeros(len(self.rows))  # Cumulative sum up to the last frame
+        self.last = None  # Values of the last frame
+        self.times = numpy.zeros(self.frame_span)  # Time of each of the last frame_span frames in seconds
+        # Absolute brightness and the tile means are normalized by the span length, like in their span tables
+        self.divisors = numpy.ones((len(self.rows), self.frame_span - 1))
+        for k in range(0, len(self.rows)):
+            if (self.rows[k] == 0 or self.rows[k] >= 5):
+                self.divisors[k] = 0.7 * numpy.arange(1, self.frame_span)
+        self.frames = 0  # Number of frames pushed so far
+        self.frames_done = 0  # Number of leading frames whose peak is known
+        self.seconds_above = {threshold: 0.0 for threshold in thresholds}
+        self.start_above = {threshold: None for threshold in thresholds}  # Time the current crossing of each threshold began
+        self.peak = 0.0
+        self.peak_frame = 0
+        self.peak_seconds = 0.0
+        self.events = []
+        self.is_unsafe = False
+        self.is_flushed = False
+
+    # Adds the 5 brightness values of the next frame (followed by its tile means, see above) and its time in seconds
+    def push(self, values, seconds=None):
+        if (self.frames > 0):
+            last_seconds = self.get_seconds(self.frames - 1)
+            if (seconds == None or not seconds > last_seconds):
+                seconds = last_seconds + 1 / self.fps
+        elif (seconds == None):
+            seconds = 0.0
+        self.times[self.frames % self.frame_span] = seconds
+        current = numpy.asarray(values, dtype=numpy.float64)[self.rows]
+        if (self.last is not None):
+            self.total += numpy.abs(current - self.last)
+        self.last = current
+        self.ring[:, self.frames % self.frame_span] = self.total
+        self.frames += 1
+        if (self.total.max() > rebase_limit):
+            offset = self.ring.min(axis=1)
+            self.ring -= offset[:, None]
+            self.total -= offset
+        if (self.frames >= self.frame_span):
+            self.finish_frame(self.frames - self.frame_span, self.frame_span)
+
+    # Time of frame i, one of the last frame_span frames. The frame after the last one starts 1 / fps after it.
+    def get_seconds(self, i):
+        if (i >= self.frames):
+            return self.times[(self.frames - 1) % self.frame_span] + (i - self.frames + 1) / self.fps
+        return self.times[i % self.frame_span]
+
+    # Determines the peak of frame i from the cumulative sums of frames i...i+count-1
+    def finish_frame(self, i, count):
+        peak = 0.0
+        if (count > 1):
+            window = self.ring[:, (i + numpy.arange(0, count)) % self.frame_span]
+            peak = float(((window[:, 1:] - window[:, :1]) / self.divisors[:, :count - 1]).max())
+        self.frames_done = i + 1
+        if (peak > self.peak):
+            self.peak = peak
+            self.peak_frame = i
+            self.peak_seconds = self.get_seconds(i)
+        if (peak > self.stop_threshold):
+            self.is_unsafe = True
+        for threshold in self.thresholds:
+            if (peak > threshold):
+                self.seconds_above[threshold] += self.get_seconds(i + 1) - self.get_seconds(i)  # How long frame i is shown
+                if (self.start_above[threshold] == None):
+                    self.start_above[threshold] = float(self.get_seconds(i))
+                    self.emit("above", threshold, i)
+            elif (self.start_above[threshold] != None):
+                self.emit("below", threshold, i)
+                self.start_above[threshold] = None
+
+    def emit(self, kind, threshold, frame):
+        event = {"event": kind, "threshold": threshold, "frame": frame, "seconds": float(self.get_seconds(frame))}
+        if (kind == "below"):
+            event["duration"] = event["seconds"] - self.start_above[threshold]
+        self.events.append(event)
+        if (self.on_event != None):
+            self.on_event(event)
+
+    # Determines the peaks of the last frames, whose spans reach past the end of the input, and closes open crossings
+    def flush(self):
+        if (self.is_flushed):
+            return
+        self.is_flushed = True
+        for i in range(max(0, self.frames - self.frame_span + 1), self.frames):
+            self.finish_frame(i, self.frames - i)
+        for threshold in self.thresholds:
+            if (self.start_above[threshold] != None):
+                self.emit("below", threshold, self.frames)
+                self.start_above[threshold] = None
+
+    # Same key figures as summarize_job, plus the verdict and all threshold crossings
+    def summarize(self):
+        return {"peak": self.peak, "peakSeconds": float(self.peak_seconds),
+                "secondsAbove": {str(threshold): float(self.seconds_above[threshold]) for threshold in self.thresholds},
+                "verdict": "unsafe" if self.is_unsafe else "ok", "frames": self.frames_done, "events": self.events}
+
+
+def print_event(event):
+    print("Flashing " + event["event"] + " " + str(event["threshold"]) + " at " + str(round(event["seconds"], 2)) + " s" + (" (for " + str(round(event["duration"], 2)) + " s)" if "duration" in event else ""))
+
+
+# Analyzes one or more video files as a single stream, e.g. a recording split into parts or episodes played back to back,
+# and returns the summary. Only the detector's state is kept, so memory does not depend on the length of the input.
+# With 'is_stopOnUnsafe', reading stops as soon as the verdict is "unsafe". Times are those the files report for their
+# frames, each file following on from the end of the one before.
+# By default, all metrics are followed (type 0), so the verdict does not miss e.g. flashing in a single color channel.
+def stream_file(file_paths, frame_span=20, type=0, on_event=print_event, is_stopOnUnsafe=False, report=None):
+    if (isinstance(file_paths, str)):
+        file_paths = [file_paths]
+    detector = None
+    reducer = FrameReducer()
+    is_complete = True
+    offset = 0.0  # Time the current file starts at
+    for file_path in file_paths:
+        cap = cv2.VideoCapture(file_path)
+        if (not cap.isOpened()):
+            raise IOError("Could not open video file " + str(file_path))
+        if (detector == None):
+            detector = StreamDetector(frame_span, cap.get(cv2.CAP_PROP_FPS), type, on_event=on_event)
+        elif (detector.frames > 0):
+            offset = detector.get_seconds(detector.frames)
+        frame_count = detector.frames + int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        while True:
+            is_validFrame, frame = cap.read()
+            if not is_validFrame:
+                break
+            detector.push(reducer.reduce(frame), offset + cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+            if (report != None):
+                report("Streaming " + file_path, detector.frames, max(detector.frames, frame_count))
+            if (is_stopOnUnsafe and detector.is_unsafe):
+                is_complete = False
+                break
+        cap.release()
+        if (not is_complete):
+            break
+    if (detector == None):
+        return None
+    detector.flush()
+    summary = detector.summarize()
+    summary.update({"files": file_paths, "isComplete": is_complete})
+    return summary